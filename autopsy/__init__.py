@@ -0,0 +1,4 @@
+"""
+Trade Autopsy core: UI-independent building blocks shared by the
+Streamlit app, background workers and command-line jobs.
+"""
@@ -0,0 +1,137 @@
+"""
+Incrementally maintained per-user dashboard aggregates.
+
+One small record per user holds everything the Performance Metrics KPI
+row needs (sums, counts, tag counters, score-band histogram and the
+rolling window used for the trend arrow), plus the BehaviorState behind the
+AI Insights panel. It is updated on every insert, so rendering the KPI row
+and insights costs one row fetch regardless of history length.
+"""
+from collections import Counter
+from datetime import datetime, timezone
+
+from .behavior import BehaviorState
+from .tags import OTHER, TAXONOMY
+
+SCORE_BANDS = ("Poor (0-40)", "Fair (40-60)", "Good (60-80)", "Excellent (80-100)")
+BAND_EDGES = (40, 60, 80)           # right-inclusive upper edges of the first three bands
+QUALITY_THRESHOLD = 60              # score > 60 counts towards "Quality Rate"
+TREND_WINDOW = 5                    # last 5 vs previous 5 audits
+
+def score_band(score):
+    """Index into SCORE_BANDS for a 0-100 score"""
+    for i, edge in enumerate(BAND_EDGES):
+        if score <= edge:
+            return i
+    return len(BAND_EDGES)
+
+class UserAggregates:
+    """Running totals for one user's audit history"""
+
+    def __init__(self, user_id, total_audits=0, score_sum=0, quality_count=0,
+                 tag_counts=None, band_counts=None, recent_scores=None, behavior=None,
+                 updated_at=None, rebuilt_through=None):
+        # tag_counts is keyed by taxonomy code (JSON object keys are strings)
+        self.user_id = user_id
+        self.total_audits = total_audits
+        self.score_sum = score_sum
+        self.quality_count = quality_count
+        self.tag_counts = Counter({int(code): n for code, n in (tag_counts or {}).items()})
+        self.band_counts = list(band_counts or [0] * len(SCORE_BANDS))
+        self.recent_scores = list(recent_scores or [])   # newest first, 2 * TREND_WINDOW max
+        self.behavior = behavior if isinstance(behavior, BehaviorState) else BehaviorState.from_dict(behavior)
+        self.updated_at = updated_at
+        # Highest trades.id a rebuild from history folded in; saves of trades
+        # up to it are already counted and must not be added again
+        self.rebuilt_through = rebuilt_through
+
+    # --- updates ---
+    def add(self, score, tag_codes, created_at=None):
+        """Fold one new audit into the totals - O(1) in history length"""
+        score = int(score)
+        self.total_audits += 1
+        self.score_sum += score
+        if score > QUALITY_THRESHOLD:
+            self.quality_count += 1
+        self.tag_counts.update(tag_codes or [])
+        self.band_counts[score_band(score)] += 1
+        self.recent_scores = ([score] + self.recent_scores)[:2 * TREND_WINDOW]
+        self.behavior.add(score, tag_codes, created_at)
+        self.updated_at = datetime.now(timezone.utc).isoformat()
+        return self
+
+    @classmethod
+    def from_history(cls, user_id, scores, tag_code_lists, created_ats=None):
+        """Rebuild from a full history (oldest first) - used once for pre-existing users"""
+        agg = cls(user_id)
+        for score, codes, created_at in zip(scores, tag_code_lists, created_ats if created_ats is not None else [None] * len(scores)):
+            agg.add(score, codes, created_at)
+        return agg
+
+    # --- derived KPIs ---
+    @property
+    def avg_score(self):
+        return self.score_sum / self.total_audits if self.total_audits else 0
+
+    @property
+    def quality_rate(self):
+        return self.quality_count / self.total_audits * 100 if self.total_audits else 0
+
+    @property
+    def top_mistake(self):
+        top = self.top_tags(1)
+        return top[0][0] if top else "None"
+
+    @property
+    def trend(self):
+        recent = self.recent_scores[:TREND_WINDOW]
+        previous = self.recent_scores[TREND_WINDOW:2 * TREND_WINDOW]
+        recent_avg = sum(recent) / len(recent) if len(recent) >= TREND_WINDOW else self.avg_score
+        prev_avg = sum(previous) / len(previous) if len(previous) >= TREND_WINDOW else self.avg_score
+        return "↗" if recent_avg > prev_avg else "↘" if recent_avg < prev_avg else "→"
+
+    def top_tags(self, n=6):
+        """[(canonical tag, count)] most frequent first, unmatched tags excluded"""
+        # Ties go to the lower code, so incremental and rebuilt rows rank alike
+        ranked = sorted(((code, n_) for code, n_ in self.tag_counts.items() if code != OTHER and n_),
+                        key=lambda item: (-item[1], item[0]))
+        return [(TAXONOMY[code], count) for code, count in ranked[:n]]
+
+    def band_distribution(self):
+        """[(band, count, pct)] ordered by count, largest first"""
+        order = sorted(range(len(SCORE_BANDS)), key=lambda i: -self.band_counts[i])
+        return [
+            (SCORE_BANDS[i], self.band_counts[i],
+             self.band_counts[i] / self.total_audits * 100 if self.total_audits else 0)
+            for i in order
+        ]
+
+    # --- (de)serialization for the user_aggregates table ---
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            row["user_id"],
+            total_audits=row.get("total_audits", 0),
+            score_sum=row.get("score_sum", 0),
+            quality_count=row.get("quality_count", 0),
+            tag_counts=row.get("tag_counts"),
+            band_counts=row.get("band_counts"),
+            recent_scores=row.get("recent_scores"),
+            behavior=row.get("behavior"),
+            updated_at=row.get("updated_at"),
+            rebuilt_through=row.get("rebuilt_through"),
+        )
+
+    def to_row(self):
+        return {
+            "user_id": self.user_id,
+            "total_audits": self.total_audits,
+            "score_sum": self.score_sum,
+            "quality_count": self.quality_count,
+            "tag_counts": {str(code): n for code, n in self.tag_counts.items()},
+            "band_counts": self.band_counts,
+            "recent_scores": self.recent_scores,
+            "behavior": self.behavior.to_dict(),
+            "updated_at": self.updated_at,
+            "rebuilt_through": self.rebuilt_through,
+        }
@@ -0,0 +1,66 @@
+"""
+Vectorized analytics for the Performance Metrics tab.
+
+summarize() takes the projected history frame (created_at, score,
+mistake_tag_codes; newest first, as returned by fetch_score_series) and
+computes the evolution chart series plus full-history tag and band counts
+in one pass over NumPy arrays. The KPI row, tag and band panels render
+from UserAggregates; the counts here only seed that row on a rebuild.
+"""
+from dataclasses import dataclass
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from .aggregates import BAND_EDGES, QUALITY_THRESHOLD, SCORE_BANDS, TREND_WINDOW, UserAggregates
+from .tags import TAXONOMY
+
+@dataclass(frozen=True)
+class DashboardSummary:
+    total_audits: int
+    tag_counts: np.ndarray          # bincount indexed by taxonomy code
+    band_counts: np.ndarray         # Poor / Fair / Good / Excellent
+    scores: np.ndarray              # newest first
+    chart_data: pd.DataFrame        # oldest first: created_at, score, index
+
+    def to_aggregates(self, user_id, behavior=None):
+        """Seed a UserAggregates row from a full-history summary (+ replayed BehaviorState)"""
+        nonzero = np.flatnonzero(self.tag_counts)
+        return UserAggregates(
+            user_id,
+            total_audits=self.total_audits,
+            score_sum=int(self.scores.sum()),
+            quality_count=int((self.scores > QUALITY_THRESHOLD).sum()),
+            tag_counts={int(code): int(self.tag_counts[code]) for code in nonzero},
+            band_counts=[int(c) for c in self.band_counts],
+            recent_scores=self.scores[:2 * TREND_WINDOW].tolist(),
+            behavior=behavior,
+        )
+
+def summarize(frame):
+    """One vectorized pass over a newest-first (created_at, score, mistake_tag_codes) frame"""
+    scores = frame["score"].to_numpy(dtype=np.int64)
+    n = len(scores)
+
+    # Flatten the per-audit code lists straight into an integer array
+    flat = np.fromiter(
+        chain.from_iterable(codes for codes in frame["mistake_tag_codes"].tolist() if codes),
+        dtype=np.int64,
+    )
+    tag_counts = np.bincount(flat, minlength=len(TAXONOMY))
+
+    # Band i covers (BAND_EDGES[i-1], BAND_EDGES[i]]
+    band_counts = np.bincount(np.searchsorted(BAND_EDGES, scores, side="left"), minlength=len(SCORE_BANDS))
+
+    # History arrives newest first, so reversing gives chronological order without a sort
+    chart_data = frame[["created_at", "score"]].iloc[::-1].reset_index(drop=True)
+    chart_data["index"] = np.arange(n)
+
+    return DashboardSummary(
+        total_audits=n,
+        tag_counts=tag_counts,
+        band_counts=band_counts,
+        scores=scores,
+        chart_data=chart_data,
+    )
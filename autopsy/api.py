@@ -0,0 +1,270 @@
+"""
+Headless REST API for programmatic audits, backed by the same AuditEngine
+as the Streamlit app.
+
+    gunicorn "autopsy.api:create_app()"       # settings in gunicorn.conf.py
+    python -m autopsy.api --port 8000         # single-process dev server
+
+Configuration comes from the environment, using the same keys as
+.streamlit/secrets.toml (HF_TOKEN, STORAGE_BACKEND, SUPABASE_URL,
+SUPABASE_KEY, LOCAL_DB_PATH), plus:
+
+    API_KEYS         = "key1:user_a,key2:user_b"   (bearer key -> user id)
+    JOBS_DB_PATH     = "data/jobs.db"
+    API_JOB_THREADS  = 4                            (model calls in flight per worker)
+    USER_PLANS       = "user_a:pro,user_b:desk"     (plan tier per user, default free)
+    GLOBAL_AUDITS_PER_MINUTE, GLOBAL_AUDIT_BURST    (shared HF_TOKEN budget)
+    JOB_CLASS_CAPS   = "bulk:1"                     (running jobs per priority class)
+    PROMPT_VARIANT   = "full"                       (full / compact / ab - see autopsy/prompts.py)
+    VISION_ROUTING   = "on"                         ("off" sends every chart the combined prompt)
+
+Audits are asynchronous: a submit returns 202 with a job id, and the
+report is fetched by polling the job. A submit over the caller's plan
+limits (autopsy/ratelimit.py) gets 429 with a Retry-After header. Jobs
+go through the durable queue in autopsy/jobs.py, so any gunicorn worker
+(or the Streamlit server) on the host that writes to the same storage
+backend may run them, and a worker restart does not lose them.
+
+    POST /v1/audits/text        JSON trade parameters
+    POST /v1/audits/chart       multipart "image" (or JSON "image_b64") + manual_* fields
+    POST /v1/audits/portfolio   total_invested, current_value, num_positions [+ image]
+    POST /v1/audits/batch       JSON {"trades": [text audit fields, ...]} - bulk import,
+                                queued behind interactive audits
+    GET  /v1/jobs/<job_id>      status; the parsed report once done
+    GET  /v1/history?limit=50   saved audits, newest first (no raw completions)
+    GET  /v1/aggregates         KPI totals for the caller
+    GET  /v1/usage              plan tier and today's quota use
+    GET  /v1/queue              queue depth and wait times per priority class
+    GET  /healthz               storage round-trip, no auth
+"""
+import argparse
+import base64
+import binascii
+import io
+import logging
+import math
+import os
+
+from flask import Flask, abort, g, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+from .engine import AuditEngine, encode_image
+from .inference import InferenceClient
+from .jobs import DEFAULT_JOBS_DB_PATH, JobQueue, JobStore, parse_class_caps
+from .prompts import FULL
+from .ratelimit import RateLimited, RateLimiter
+from .records import REPORT_COLUMNS
+from .resources import create_http_session
+from .storage import create_repository, storage_target
+from .telemetry import CompletionBudgets
+
+log = logging.getLogger(__name__)
+
+HISTORY_COLUMNS = ("id", "created_at", "ticker", "analysis_mode", *REPORT_COLUMNS.values(),
+                   "model_id", "prompt_version")
+HISTORY_LIMIT = 50
+MAX_HISTORY_LIMIT = 500
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024      # same cap as the UI uploader
+MAX_BATCH_TRADES = 500
+
+def parse_api_keys(value):
+    """API_KEYS ("key1:user_a,key2:user_b") -> {key: user_id}"""
+    keys = {}
+    for pair in (value or "").split(","):
+        key, sep, user_id = pair.strip().partition(":")
+        if sep and key and user_id:
+            keys[key.strip()] = user_id.strip()
+    return keys
+
+# --- request parsing ---
+def _fields():
+    """JSON body or form fields, whichever the client sent"""
+    if request.is_json:
+        return request.get_json(silent=True) or {}
+    return request.form.to_dict()
+
+def _number(fields, name, default=0.0, cast=float):
+    value = fields.get(name, default)
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        abort(400, f"'{name}' must be a number")
+
+def _trade(fields):
+    """Text-audit params (engine.AuditEngine.audit_trade) from request fields"""
+    ticker = fields.get("ticker") or ""
+    if not isinstance(ticker, str):
+        abort(400, "'ticker' must be a string")
+    ticker = ticker.strip()
+    if not ticker:
+        abort(400, "'ticker' is required")
+    return {
+        "ticker": ticker,
+        "setup_type": fields.get("setup_type", "Trend"),
+        "emotion": fields.get("emotion", "Neutral"),
+        "entry": _number(fields, "entry"),
+        "exit_price": _number(fields, "exit"),
+        "stop": _number(fields, "stop"),
+        "notes": fields.get("notes", ""),
+    }
+
+def _image(fields, required=False):
+    """Uploaded image -> downscaled PNG base64 (None when optional and absent)"""
+    if "image" in request.files:
+        fp = request.files["image"].stream
+    elif fields.get("image_b64"):
+        try:
+            fp = io.BytesIO(base64.b64decode(fields["image_b64"], validate=True))
+        except (binascii.Error, ValueError):
+            abort(400, "'image_b64' is not valid base64")
+    elif required:
+        abort(400, "an 'image' upload or 'image_b64' field is required")
+    else:
+        return None
+    try:
+        return encode_image(fp)
+    except Exception:
+        abort(400, "could not read the image (PNG or JPG expected)")
+
+def create_app(config=None):
+    config = os.environ if config is None else config
+
+    repo = create_repository(config)
+    if repo is None:
+        raise RuntimeError("The API needs a storage backend (STORAGE_BACKEND / SUPABASE_URL + SUPABASE_KEY)")
+    engine = AuditEngine(
+        InferenceClient(config.get("HF_TOKEN", ""), session=create_http_session(), notify=log.warning),
+        repo,
+        prompt_variant=config.get("PROMPT_VARIANT") or FULL,
+        budgets=CompletionBudgets(),
+        route_images=config.get("VISION_ROUTING") != "off",
+    )
+    jobs = JobStore(config.get("JOBS_DB_PATH") or DEFAULT_JOBS_DB_PATH)
+    limiter = RateLimiter.from_config(config, jobs.path)
+    queue = JobQueue(jobs, engine.handle_job, workers=int(config.get("API_JOB_THREADS") or 4), limiter=limiter,
+                     caps=parse_class_caps(config.get("JOB_CLASS_CAPS")), backend=storage_target(config))
+    api_keys = parse_api_keys(config.get("API_KEYS"))
+
+    app = Flask(__name__)
+    app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+
+    @app.before_request
+    def authenticate():
+        if request.endpoint in (None, "healthz"):
+            return
+        scheme, _, key = request.headers.get("Authorization", "").partition(" ")
+        user_id = api_keys.get(key.strip()) if scheme.lower() == "bearer" else None
+        if user_id is None:
+            abort(401, "missing or unknown API key")
+        g.user_id = user_id
+
+    @app.errorhandler(HTTPException)
+    def json_error(e):
+        return jsonify(error=e.description), e.code
+
+    @app.errorhandler(RateLimited)
+    def rate_limited(e):
+        retry_after = max(1, math.ceil(e.retry_after))
+        return jsonify(error=str(e), retry_after=retry_after), 429, {"Retry-After": str(retry_after)}
+
+    def submit(kind, params):
+        """Queue an audit (engine.JOB_KINDS); the job saves it to the caller's history"""
+        job_id = queue.submit(g.user_id, kind, params)
+        return jsonify(job_id=job_id, status="queued", poll=f"/v1/jobs/{job_id}"), 202
+
+    # --- audits ---
+    @app.post("/v1/audits/text")
+    def audit_text():
+        return submit("text", _trade(_fields()))
+
+    @app.post("/v1/audits/chart")
+    def audit_chart():
+        f = _fields()
+        img_b64 = _image(f, required=True)
+        manual = {k: f.get(k, "") for k in ("manual_ticker", "manual_pnl", "manual_pnl_pct", "manual_price_range")}
+        return submit("chart", {"img_b64": img_b64, **manual})
+
+    @app.post("/v1/audits/portfolio")
+    def audit_portfolio():
+        f = _fields()
+        total_invested = _number(f, "total_invested")
+        current_value = _number(f, "current_value")
+        num_positions = _number(f, "num_positions", default=10, cast=int)
+        # A wiped-out portfolio (current_value 0) is exactly what the audit is for
+        if total_invested <= 0:
+            abort(400, "'total_invested' must be positive")
+        if current_value < 0:
+            abort(400, "'current_value' cannot be negative")
+        img_b64 = _image(f)
+        return submit("portfolio", {"total_invested": total_invested, "current_value": current_value,
+                                    "num_positions": num_positions, "img_b64": img_b64})
+
+    @app.post("/v1/audits/batch")
+    def audit_batch():
+        trades = (request.get_json(silent=True) or {}).get("trades")
+        if not isinstance(trades, list) or not trades:
+            abort(400, "'trades' must be a non-empty JSON list")
+        if len(trades) > MAX_BATCH_TRADES:
+            abort(400, f"at most {MAX_BATCH_TRADES} trades per batch")
+        if not all(isinstance(t, dict) for t in trades):
+            abort(400, "each trade must be a JSON object")
+        job_ids = queue.submit_bulk(g.user_id, "text", [_trade(t) for t in trades])
+        return jsonify(job_ids=job_ids, status="queued"), 202
+
+    # --- reads ---
+    @app.get("/v1/jobs/<job_id>")
+    def get_job(job_id):
+        job = jobs.get(job_id)
+        if job is None or job["user_id"] != g.user_id:
+            abort(404, "no such job")
+        job.pop("params", None)        # may carry the uploaded image
+        return jsonify(job)
+
+    @app.get("/v1/history")
+    def history():
+        limit = min(max(request.args.get("limit", HISTORY_LIMIT, type=int), 1), MAX_HISTORY_LIMIT)
+        return jsonify(audits=repo.fetch_history(g.user_id, columns=HISTORY_COLUMNS, limit=limit))
+
+    @app.get("/v1/aggregates")
+    def aggregates():
+        agg = engine.load_aggregates(g.user_id)
+        if agg is None:
+            return jsonify(user_id=g.user_id, total_audits=0)
+        return jsonify(
+            user_id=agg.user_id,
+            total_audits=agg.total_audits,
+            avg_score=round(agg.avg_score, 1),
+            quality_rate=round(agg.quality_rate, 1),
+            trend=agg.trend,
+            top_mistake=agg.top_mistake,
+            top_tags=agg.top_tags(),
+            score_bands=[{"band": band, "count": n, "pct": round(pct, 1)} for band, n, pct in agg.band_distribution()],
+            updated_at=agg.updated_at,
+        )
+
+    @app.get("/v1/usage")
+    def usage():
+        return jsonify(user_id=g.user_id, **limiter.usage(g.user_id))
+
+    @app.get("/v1/queue")
+    def queue_stats():
+        return jsonify(classes=jobs.class_stats())
+
+    @app.get("/healthz")
+    def healthz():
+        repo.ping()
+        return jsonify(status="ok", storage=repo.name)
+
+    return app
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m autopsy.api", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    create_app().run(host=args.host, port=args.port, threaded=True)
+
+if __name__ == "__main__":
+    main()
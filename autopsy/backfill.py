@@ -0,0 +1,114 @@
+"""
+Offline re-parse / backfill job.
+
+Re-runs parse_report (and the validate_score rules it applies) over every
+stored raw completion and writes back only the fields whose value changed.
+Parser and scoring-rule fixes ship without calling the model again. Rows
+without a raw completion still get their mistake_tag_codes encoded from
+the raw tags when missing. Users whose scores or tags changed get their
+user_aggregates row dropped at the end of the run, so the dashboard
+rebuilds it from the corrected history on next load.
+
+Usage:
+    SUPABASE_URL=... SUPABASE_KEY=... python -m autopsy.backfill --workers 4
+    STORAGE_BACKEND=sqlite python -m autopsy.backfill   # local database
+    python -m autopsy.backfill --dry-run          # report changes only
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from .parsing import PARSER_VERSION, parse_report, enforce_catastrophe_rules
+from .records import REPORT_COLUMNS, report_to_columns
+from .storage import SCORE_SERIES_COLUMNS, create_repository
+from .tags import codes_missing, encode_tags
+
+FETCH_COLUMNS = ("id", "user_id", "analysis_mode", "raw_response", *REPORT_COLUMNS.values())
+
+# Columns folded into user_aggregates / BehaviorState
+AGGREGATE_COLUMNS = set(SCORE_SERIES_COLUMNS)
+
+# Modes whose UI flow applies enforce_catastrophe_rules after parsing
+CATASTROPHE_RULE_MODES = {"Text Parameters", "Chart Vision", "Portfolio Analysis"}
+
+def reparse_row(row):
+    """Return (id, user_id, {column: new_value}) for the columns that changed"""
+    if row.get("raw_response") is None:
+        # Nothing to re-parse; only pre-taxonomy tags to encode
+        if codes_missing(row.get("mistake_tag_codes"), row.get("mistake_tags")):
+            return row["id"], row["user_id"], {"mistake_tag_codes": encode_tags(row.get("mistake_tags"))}
+        return row["id"], row["user_id"], {}
+    report = parse_report(row["raw_response"])
+    if row.get("analysis_mode") in CATASTROPHE_RULE_MODES:
+        enforce_catastrophe_rules(report, row["raw_response"])
+    changed = {
+        column: value
+        for column, value in report_to_columns(report).items()
+        if row.get(column) != value
+    }
+    if changed:
+        changed["parser_version"] = PARSER_VERSION
+    return row["id"], row["user_id"], changed
+
+def run_backfill(repo, chunk_size=2000, workers=None, dry_run=False, log=print):
+    """Re-parse the whole history; returns (rows_scanned, rows_changed, field_counts)"""
+    field_counts = Counter()
+    stale_users = set()
+    scanned = changed_rows = 0
+    started = time.perf_counter()
+
+    n_workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        for rows in repo.iter_trades(FETCH_COLUMNS, chunk_size):
+            batch = max(1, len(rows) // (n_workers * 4))
+            changes = [c for c in pool.map(reparse_row, rows, chunksize=batch) if c[2]]
+            for _, _, changed in changes:
+                field_counts.update(changed.keys() - {"parser_version"})
+            stale_users.update(user_id for _, user_id, changed in changes if changed.keys() & AGGREGATE_COLUMNS)
+
+            if changes and not dry_run:
+                repo.bulk_update([
+                    {"id": row_id, "user_id": user_id, **changed}
+                    for row_id, user_id, changed in changes
+                ])
+
+            scanned += len(rows)
+            changed_rows += len(changes)
+            elapsed = time.perf_counter() - started
+            log(f"scanned={scanned} changed={changed_rows} rate={scanned / max(elapsed, 1e-9):,.0f} rows/s")
+
+    if stale_users and not dry_run:
+        stale_users = sorted(stale_users)
+        for start in range(0, len(stale_users), chunk_size):
+            repo.delete_aggregates(stale_users[start:start + chunk_size])
+        log(f"dropped aggregates of {len(stale_users)} users; rebuilt on next load")
+
+    return scanned, changed_rows, field_counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-parse stored raw completions with the current parser")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="rows fetched per page")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument("--dry-run", action="store_true", help="report changes without writing them")
+    args = parser.parse_args(argv)
+
+    repo = create_repository(os.environ)
+    if repo is None:
+        print("No storage configured: set SUPABASE_URL/SUPABASE_KEY or STORAGE_BACKEND=sqlite", file=sys.stderr)
+        return 2
+
+    print(f"Backfilling {repo.name} with parser {PARSER_VERSION}{' (dry run)' if args.dry_run else ''}")
+    scanned, changed_rows, field_counts = run_backfill(
+        repo, chunk_size=args.chunk_size, workers=args.workers, dry_run=args.dry_run
+    )
+
+    print(f"\nDone: {changed_rows}/{scanned} rows changed")
+    for field, count in field_counts.most_common():
+        print(f"  {field:<20} {count}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+Rolling-window behavioral state for the AI Insights panel.
+
+BehaviorState is folded forward one audit at a time (O(1) per audit, like
+UserAggregates) and persisted inside the user's aggregates row. It tracks:
+
+    - rolling mean score over each window in ROLLING_WINDOWS
+    - current / longest streak of low-score audits (score <= LOW_SCORE)
+    - time between audits (last gap, running mean, quick re-entries
+      after a low score)
+    - emotion-state transitions between consecutive audits
+    - FOMO -> Revenge sequences: a Revenge-tagged audit directly after a
+      FOMO-tagged one, timestamped so they can be counted over any window
+      up to SEQUENCE_RETENTION_DAYS
+"""
+from bisect import bisect_left
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+
+from .tags import EMOTION_CODES, FOMO, REVENGE, TAXONOMY
+
+ROLLING_WINDOWS = (3, 10)           # short (tilt / flow) and medium windows
+LOW_SCORE = 40                      # "Poor" band upper edge
+REENTRY_MINUTES = 30                # next audit this soon after a low score
+SEQUENCE_RETENTION_DAYS = 90        # longest window sequence counts support
+CALM = "Calm"                       # emotion state of an audit with no emotion tag
+
+def _as_utc(value):
+    """datetime / pandas Timestamp / ISO string -> aware UTC datetime"""
+    if value is None:
+        return datetime.now(timezone.utc)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    elif hasattr(value, "to_pydatetime"):
+        value = value.to_pydatetime()
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+def _iso(at):
+    # Fixed-width so ISO strings sort chronologically
+    return at.isoformat(timespec="microseconds")
+
+def emotion_state(tag_codes):
+    """Dominant emotion tag of one audit (lowest taxonomy code), or CALM"""
+    emotions = [c for c in tag_codes or [] if c in EMOTION_CODES]
+    return TAXONOMY[min(emotions)] if emotions else CALM
+
+class BehaviorState:
+    """Incremental behavioral metrics for one user's audit timeline"""
+
+    def __init__(self, scores=None, low_streak=0, longest_low_streak=0,
+                 last_at=None, last_gap_s=None, gap_count=0, gap_mean_s=0.0,
+                 quick_reentries=0, last_state=CALM, last_codes=None,
+                 transitions=None, fomo_revenge_at=None):
+        self.scores = deque(scores or [], maxlen=max(ROLLING_WINDOWS))   # oldest first
+        self.low_streak = low_streak
+        self.longest_low_streak = longest_low_streak
+        self.last_at = last_at                      # ISO timestamp of the latest audit
+        self.last_gap_s = last_gap_s
+        self.gap_count = gap_count
+        self.gap_mean_s = gap_mean_s
+        self.quick_reentries = quick_reentries
+        self.last_state = last_state
+        self.last_codes = list(last_codes or [])
+        self.transitions = Counter(transitions or {})    # "FOMO>Tilt" -> count
+        self.fomo_revenge_at = list(fomo_revenge_at or [])   # ISO timestamps, oldest first
+
+    # --- updates ---
+    def add(self, score, tag_codes, created_at=None):
+        """Fold one audit (in chronological order) into the state"""
+        score = int(score)
+        tag_codes = [int(c) for c in tag_codes or []]
+        at = _as_utc(created_at)
+
+        if self.last_at is not None:
+            gap = max((at - _as_utc(self.last_at)).total_seconds(), 0.0)
+            self.gap_count += 1
+            self.gap_mean_s += (gap - self.gap_mean_s) / self.gap_count
+            self.last_gap_s = gap
+            if self.scores and self.scores[-1] <= LOW_SCORE and gap <= REENTRY_MINUTES * 60:
+                self.quick_reentries += 1
+
+        if score <= LOW_SCORE:
+            self.low_streak += 1
+            self.longest_low_streak = max(self.longest_low_streak, self.low_streak)
+        else:
+            self.low_streak = 0
+        self.scores.append(score)
+
+        state = emotion_state(tag_codes)
+        if self.last_at is not None:
+            self.transitions[f"{self.last_state}>{state}"] += 1
+        self.last_state = state
+
+        if REVENGE in tag_codes and FOMO in self.last_codes:
+            self.fomo_revenge_at.append(_iso(at))
+        # Timestamps arrive in order, so expiry only ever trims the front
+        cutoff = _iso(at - timedelta(days=SEQUENCE_RETENTION_DAYS))
+        del self.fomo_revenge_at[:bisect_left(self.fomo_revenge_at, cutoff)]
+
+        self.last_codes = tag_codes
+        self.last_at = _iso(at)
+        return self
+
+    @classmethod
+    def from_history(cls, frame):
+        """Replay a chronological (created_at, score, mistake_tag_codes) frame"""
+        state = cls()
+        for created_at, score, codes in zip(frame["created_at"], frame["score"], frame["mistake_tag_codes"]):
+            state.add(score, codes, created_at)
+        return state
+
+    # --- derived metrics ---
+    def rolling_mean(self, window=ROLLING_WINDOWS[0]):
+        """Mean of the last `window` scores (None until that many audits exist)"""
+        if window > self.scores.maxlen:
+            raise ValueError(f"window {window} exceeds the tracked {self.scores.maxlen} audits")
+        if len(self.scores) < window:
+            return None
+        recent = list(self.scores)[-window:]
+        return sum(recent) / window
+
+    def fomo_revenge_count(self, days=30, now=None):
+        """FOMO -> Revenge sequences in the trailing `days` (<= SEQUENCE_RETENTION_DAYS)"""
+        cutoff = _iso(_as_utc(now) - timedelta(days=days))
+        return len(self.fomo_revenge_at) - bisect_left(self.fomo_revenge_at, cutoff)
+
+    def emotional_transitions(self):
+        """[(from, to, count)] for state changes into an emotion, most frequent first"""
+        out = []
+        for key, count in self.transitions.most_common():
+            src, dst = key.split(">", 1)
+            if dst != CALM and src != dst:
+                out.append((src, dst, count))
+        return out
+
+    # --- (de)serialization for user_aggregates.behavior ---
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**(data or {}))
+
+    def to_dict(self):
+        return {
+            "scores": list(self.scores),
+            "low_streak": self.low_streak,
+            "longest_low_streak": self.longest_low_streak,
+            "last_at": self.last_at,
+            "last_gap_s": self.last_gap_s,
+            "gap_count": self.gap_count,
+            "gap_mean_s": self.gap_mean_s,
+            "quick_reentries": self.quick_reentries,
+            "last_state": self.last_state,
+            "last_codes": self.last_codes,
+            "transitions": dict(self.transitions),
+            "fomo_revenge_at": self.fomo_revenge_at,
+        }
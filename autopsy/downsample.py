@@ -0,0 +1,83 @@
+"""
+Server-side reduction of the Performance Evolution series.
+
+The chart spec ships every row to the browser as Vega-Lite JSON (and Altair
+refuses frames over 5000 rows), so long histories are reduced before they
+reach Altair:
+
+    raw      - the visible range already fits in MAX_CHART_POINTS
+    daily /
+    weekly /
+    monthly  - min / mean / max per calendar bucket, finest one that fits
+    lttb     - Largest-Triangle-Three-Buckets down to MAX_CHART_POINTS, used
+               when even monthly buckets are too many (or timestamps are
+               missing)
+
+Either way the payload stays bounded by MAX_CHART_POINTS rows.
+"""
+import numpy as np
+import pandas as pd
+
+MAX_CHART_POINTS = 400
+
+# Range selector label -> trailing window in days (None = full history)
+CHART_RANGES = {"All": None, "1Y": 365, "90D": 90, "30D": 30}
+
+# Finest first; pandas period alias -> resolution label
+BUCKET_FREQS = (("D", "daily"), ("W", "weekly"), ("M", "monthly"))
+
+def filter_range(chart_data, days):
+    """Trailing `days` of an oldest-first chart frame (keeps the global trade index)"""
+    if not days or chart_data.empty:
+        return chart_data
+    cutoff = chart_data["created_at"].iloc[-1] - pd.Timedelta(days=days)
+    return chart_data[chart_data["created_at"] >= cutoff]
+
+def lttb(y, threshold):
+    """
+    Indices of the points Largest-Triangle-Three-Buckets keeps from `y`
+    (x is the position). First and last points are always kept.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=np.float64)
+    x = np.arange(n, dtype=np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third vertex
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+def bucket_scores(chart_data, freq):
+    """created_at (bucket start), score_min, score (mean), score_max, count per non-empty bucket"""
+    ts = chart_data["created_at"]
+    if ts.dt.tz is not None:
+        ts = ts.dt.tz_convert(None)
+    grouped = chart_data["score"].groupby(ts.dt.to_period(freq).dt.start_time)
+    out = grouped.agg(score_min="min", score="mean", score_max="max", count="size").reset_index()
+    return out.rename(columns={out.columns[0]: "created_at"})
+
+def evolution_series(chart_data, max_points=MAX_CHART_POINTS):
+    """(frame, resolution) for the visible range, at most max_points rows"""
+    if len(chart_data) <= max_points:
+        return chart_data, "raw"
+
+    if chart_data["created_at"].notna().all():
+        for freq, resolution in BUCKET_FREQS:
+            buckets = bucket_scores(chart_data, freq)
+            if len(buckets) <= max_points:
+                return buckets, resolution
+
+    keep = lttb(chart_data["score"].to_numpy(), max_points)
+    return chart_data.iloc[keep].reset_index(drop=True), "lttb"
@@ -0,0 +1,347 @@
+"""
+UI-independent analysis pipeline: inputs in, structured report out.
+
+AuditEngine ties together prompt construction (prompts.py), the inference
+client (inference.py), parsing (parsing.py) and persistence (storage.py +
+aggregates). The Streamlit app, the API server, background workers and
+batch scripts all call it the same way:
+
+    engine = AuditEngine(InferenceClient(token), repo)
+    result = engine.audit_trade("SPY", "Trend", "FOMO", 450.0, 441.0, 0.0, "chased the open")
+    engine.save(user_id, result)
+
+Nothing here imports Streamlit.
+"""
+import base64
+import io
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from .aggregates import UserAggregates
+from .analytics import summarize
+from .behavior import BehaviorState
+from .imagetype import classify_image
+from .inference import MODEL_ID
+from .parsing import PARSER_VERSION, enforce_catastrophe_rules, parse_report
+from .prompts import (
+    END_MARKER,
+    FULL,
+    PROMPT_VERSION,
+    chart_vision_prompt,
+    manual_chart_context,
+    pick_variant,
+    portfolio_audit_prompt,
+    portfolio_review_prompt,
+    trade_audit_prompt,
+)
+from .records import report_to_columns
+from .storage import SCORE_SERIES_COLUMNS
+from .tags import row_tag_codes
+from .tokens import check_budget, prompt_tokens
+
+log = logging.getLogger(__name__)
+
+# analysis_mode values stored with each trade
+TEXT_MODE = "Text Parameters"
+CHART_MODE = "Chart Vision"
+PORTFOLIO_MODE = "Portfolio Analysis"
+REVIEW_MODE = "Portfolio"           # portfolio page questionnaire
+
+# Queued job kind -> AuditEngine method (params are that method's keyword arguments)
+JOB_KINDS = {
+    "text": "audit_trade",
+    "chart": "audit_chart",
+    "portfolio": "audit_portfolio",
+    "review": "review_portfolio",
+}
+JOB_MODES = {"text": TEXT_MODE, "chart": CHART_MODE, "portfolio": PORTFOLIO_MODE, "review": REVIEW_MODE}
+
+# Completion settings for prompts sent without an image. max_tokens here
+# (and VISION_MAX_TOKENS) is the ceiling; with CompletionBudgets the engine
+# sends the smaller budget learned from recent completions of the mode
+TEXT_COMPLETION = {"max_tokens": 1500, "temperature": 0.3, "timeout": 60}
+REVIEW_COMPLETION = {"max_tokens": 2000, "temperature": 0.3, "timeout": 90}
+VISION_MAX_TOKENS = 2500
+
+# Prices from the prompt's worked examples - seeing them in [TECH] means the
+# model copied the example instead of reading the chart
+EXAMPLE_PRICES = ('$445', '$435', '$451', '$458', '$440', '$437')
+
+MAX_IMAGE_SIZE = (1920, 1080)
+
+# Compare-and-set attempts per save, with a growing random pause between them
+AGGREGATE_UPDATE_ATTEMPTS = 20
+AGGREGATE_RETRY_BACKOFF_S = 0.005
+
+@dataclass
+class AuditResult:
+    mode: str
+    ticker: str
+    report: dict
+    raw_response: str
+    meta: dict
+    warnings: list = field(default_factory=list)
+
+    def to_dict(self, raw=False):
+        """JSON-ready view for API responses; raw_response only on request"""
+        out = {"mode": self.mode, "ticker": self.ticker, "report": self.report,
+               "warnings": self.warnings, "meta": self.meta}
+        if raw:
+            out["raw_response"] = self.raw_response
+        return out
+
+def encode_image(fp, max_size=MAX_IMAGE_SIZE):
+    """Uploaded image (path or file-like) -> downscaled PNG as base64"""
+    from PIL import Image
+
+    image = Image.open(fp)
+    # Optimize image size
+    image.thumbnail(max_size, Image.Resampling.LANCZOS)
+    buf = io.BytesIO()
+    image.save(buf, format="PNG", optimize=True)
+    return base64.b64encode(buf.getvalue()).decode('utf-8')
+
+def review_warnings(report, raw_response):
+    """Post-parse checks; applies the catastrophe rules to the report in place"""
+    warning_messages = []
+
+    # Check if analysis contains common hallucinated prices that appear in examples
+    if any(price in report.get('tech', '') for price in EXAMPLE_PRICES):
+        warning_messages.append("⚠️ AI may have hallucinated prices from examples rather than analyzing your actual chart")
+
+    # AI detected catastrophe but didn't score it correctly
+    if enforce_catastrophe_rules(report, raw_response):
+        warning_messages.append("🚨 Score adjusted for catastrophic loss detected in analysis")
+
+    # Validate we got real analysis
+    if (report['score'] == 50 and
+        report['entry_quality'] == 50 and
+        report['exit_quality'] == 50):
+        warning_messages.append("⚠️ Analysis may be incomplete. Try a clearer image with visible price levels.")
+
+    return warning_messages
+
+class AuditEngine:
+    def __init__(self, client, repo=None, prompt_variant=FULL, budgets=None, route_images=True):
+        self.client = client
+        self.repo = repo
+        self.prompt_variant = prompt_variant     # PROMPT_VARIANT config: full / compact / ab
+        self.budgets = budgets                   # telemetry.CompletionBudgets; None = fixed ceilings
+        self.route_images = route_images         # classify chart uploads first (VISION_ROUTING config)
+
+    # --- analysis ---
+    @staticmethod
+    def _with_prompt(meta, prompt):
+        """Tag the call's meta with the template and the locally counted prompt size"""
+        meta["prompt_version"] = prompt.version
+        meta["prompt_tokens_local"] = prompt_tokens(prompt)
+        if meta.get("prompt_tokens") is None:     # router omitted usage
+            meta["prompt_tokens"] = meta["prompt_tokens_local"]
+        return meta
+
+    def _max_tokens(self, mode, ceiling):
+        return self.budgets.max_tokens(self.repo, mode, ceiling) if self.budgets else ceiling
+
+    def analyze(self, prompt, mode, ticker, img_b64=None, completion=TEXT_COMPLETION, checks=True):
+        """Run one rendered prompts.Prompt through the model and parse it into an AuditResult"""
+        check_budget(prompt)
+        if img_b64:
+            max_tokens = self._max_tokens(mode, VISION_MAX_TOKENS)
+            raw_response, meta = self.client.vision(prompt.user, img_b64, system=prompt.system,
+                                                    max_tokens=max_tokens, stop=[END_MARKER])
+        else:
+            max_tokens = self._max_tokens(mode, completion["max_tokens"])
+            raw_response, meta = self.client.complete(prompt.user, system=prompt.system,
+                                                      **{**completion, "max_tokens": max_tokens}, stop=[END_MARKER])
+        self._with_prompt(meta, prompt)
+        meta["max_tokens"] = max_tokens
+
+        report = parse_report(raw_response)
+        warnings = review_warnings(report, raw_response) if checks else []
+        return AuditResult(mode, ticker, report, raw_response, meta, warnings)
+
+    def classify(self, img_b64):
+        """Stage one of Chart Vision: imagetype.classify_image, None when off, ambiguous or unreadable"""
+        if not self.route_images:
+            return None
+        try:
+            return classify_image(img_b64)
+        except Exception:
+            log.warning("could not classify chart image; using the combined prompt", exc_info=True)
+            return None
+
+    def audit_chart(self, img_b64, manual_ticker="", manual_pnl="", manual_pnl_pct="", manual_price_range="",
+                    variant=FULL):
+        """Two stages: a local layout check picks the single-trade or portfolio prompt, then the model call"""
+        context = manual_chart_context(manual_ticker, manual_pnl, manual_pnl_pct, manual_price_range)
+        started_at = time.perf_counter()
+        image_type = self.classify(img_b64)
+        classify_ms = int((time.perf_counter() - started_at) * 1000)
+        prompt = chart_vision_prompt(context, variant=variant, image_type=image_type)
+        result = self.analyze(prompt, CHART_MODE, "IMG", img_b64=img_b64)
+        result.meta.update(image_type=image_type, classify_ms=classify_ms)
+        return result
+
+    def audit_trade(self, ticker, setup_type, emotion, entry, exit_price, stop, notes, variant=FULL):
+        prompt = trade_audit_prompt(ticker, setup_type, emotion, entry, exit_price, stop, notes, variant=variant)
+        return self.analyze(prompt, TEXT_MODE, ticker)
+
+    def audit_portfolio(self, total_invested, current_value, num_positions, img_b64=None, variant=FULL):
+        prompt = portfolio_audit_prompt(total_invested, current_value, num_positions, image=bool(img_b64),
+                                        variant=variant)
+        return self.analyze(prompt, PORTFOLIO_MODE, "PORTFOLIO", img_b64=img_b64)
+
+    def review_portfolio(self, total_invested, current_value, num_positions, img_b64=None, variant=FULL, **details):
+        """Portfolio page questionnaire; details are the optional portfolio_* fields"""
+        prompt = portfolio_review_prompt(total_invested, current_value, num_positions, variant=variant, **details)
+        check_budget(prompt)
+        # Sent as-is (no image-reading retries), like the original page flow
+        max_tokens = self._max_tokens(REVIEW_MODE, REVIEW_COMPLETION["max_tokens"])
+        raw_response, meta = self.client.complete(prompt.user, img_b64=img_b64, system=prompt.system,
+                                                  **{**REVIEW_COMPLETION, "max_tokens": max_tokens}, stop=[END_MARKER])
+        self._with_prompt(meta, prompt)
+        meta["max_tokens"] = max_tokens
+        return AuditResult(REVIEW_MODE, "PORTFOLIO", parse_report(raw_response), raw_response, meta)
+
+    def run(self, kind, params, variant=FULL):
+        """Run a queued audit: JOB_KINDS[kind] called with params, using the given prompt variant"""
+        return getattr(self, JOB_KINDS[kind])(**params, variant=variant)
+
+    def handle_job(self, job):
+        """
+        JobQueue handler: run the audit, log the model call and save the
+        report to the submitter's history. A failed save is reported on
+        the result instead of discarding the paid-for report.
+        """
+        started_at = time.perf_counter()
+        try:
+            result = self.run(job["kind"], job["params"], variant=pick_variant(self.prompt_variant, job["user_id"]))
+        except Exception as e:
+            meta = {"latency_ms": int((time.perf_counter() - started_at) * 1000), **getattr(e, "meta", {})}
+            self.log_inference(job, meta, error=f"{type(e).__name__}: {e}")
+            raise
+        self.log_inference(job, result.meta)
+        if self.repo is None:
+            result.warnings.append("No database configured - this report was not saved to your history.")
+            return result.to_dict()
+        try:
+            self.save(job["user_id"], result)
+        except Exception as e:
+            result.warnings.append(f"Database error: {e}")
+        return result.to_dict()
+
+    # --- persistence ---
+    def log_inference(self, job, meta, error=None):
+        """One inference_log row per model call, failed ones included (best effort)"""
+        row = {
+            "user_id": job["user_id"],
+            "job_id": job["id"],
+            "mode": JOB_MODES.get(job["kind"]),
+            "prompt_version": meta.get("prompt_version", PROMPT_VERSION),
+            "model_id": meta.get("model_id", MODEL_ID),
+            "status": "error" if error else "ok",
+            "error": error,
+            **{k: meta.get(k) for k in ("prompt_tokens", "completion_tokens", "image_bytes",
+                                        "attempts", "ttfb_ms", "latency_ms", "max_tokens", "finish_reason")},
+        }
+        if self.repo is None:
+            return
+        try:
+            self.repo.insert_inference_log(row)
+        except Exception:
+            log.warning("could not log inference call for job %s", job["id"], exc_info=True)
+
+    def save(self, user_id, result, ticker=None):
+        """
+        Persist the full structured report plus the raw completion, then
+        fold it into the user's aggregates. Keeping raw_response means
+        parse_report fixes can be re-applied offline without another call.
+        """
+        meta = result.meta or {}
+        payload = {
+            "user_id": user_id,
+            "ticker": ticker or result.ticker,
+            # Structured report incl. sub-scores (charted without re-inference)
+            **report_to_columns(result.report),
+            # Provenance for offline re-parsing
+            "analysis_mode": result.mode,
+            "raw_response": result.raw_response,
+            "model_id": meta.get('model_id', MODEL_ID),
+            "prompt_version": meta.get('prompt_version', PROMPT_VERSION),
+            "parser_version": PARSER_VERSION,
+            "prompt_tokens": meta.get('prompt_tokens'),
+            "completion_tokens": meta.get('completion_tokens'),
+            "latency_ms": meta.get('latency_ms')
+        }
+        trade_id = self.repo.insert_trade(payload)
+        self.update_aggregates(user_id, payload["score"], payload["mistake_tag_codes"], trade_id)
+        return payload
+
+    def fetch_aggregates(self, user_id):
+        """Single small-row fetch of the per-user aggregates (None if absent)"""
+        row = self.repo.fetch_aggregates(user_id)
+        return UserAggregates.from_row(row) if row else None
+
+    def load_aggregates(self, user_id):
+        """
+        Aggregates for the dashboard. Users that pre-date the table get
+        the row rebuilt once from their history.
+        """
+        agg = self.fetch_aggregates(user_id)
+        if agg is not None:
+            return agg
+        agg = self.rebuild_aggregates(user_id)
+        if agg is None or self.repo.insert_aggregates(agg.to_row()):
+            return agg
+        # A concurrent save or rebuild created the row first
+        return self.fetch_aggregates(user_id) or agg
+
+    def rebuild_aggregates(self, user_id):
+        """Aggregates replayed from the full history (None without one); not stored"""
+        hist = self.repo.fetch_history(user_id, columns=("id",) + SCORE_SERIES_COLUMNS + ("mistake_tags",))
+        if not hist:
+            return None
+        df = pd.DataFrame(hist)
+        # Rows saved before the taxonomy existed only carry raw tags
+        df['mistake_tag_codes'] = [row_tag_codes(codes, tags)
+                                   for codes, tags in zip(df['mistake_tag_codes'], df['mistake_tags'])]
+        # Replay oldest first so the behavioral state matches incremental updates
+        agg = summarize(df).to_aggregates(user_id, behavior=BehaviorState.from_history(df.iloc[::-1]))
+        agg.updated_at = datetime.now(timezone.utc).isoformat()
+        agg.rebuilt_through = int(df['id'].max())
+        return agg
+
+    def update_aggregates(self, user_id, score, tag_codes, trade_id=None):
+        """
+        Fold a freshly inserted audit (trades.id trade_id) into the user's
+        aggregates row. Writes are compare-and-set on updated_at, so
+        concurrent saves for the same user (two tabs, API workers) retry
+        instead of overwriting each other. A row rebuilt from history after
+        the trade was inserted already counts it (rebuilt_through), so the
+        audit is never added twice.
+        """
+        for attempt in range(AGGREGATE_UPDATE_ATTEMPTS):
+            if attempt:
+                time.sleep(random.uniform(0, AGGREGATE_RETRY_BACKOFF_S * attempt))
+            agg = self.fetch_aggregates(user_id)
+            if agg is None:
+                # First aggregate for this user: the rebuild covers the audit just inserted
+                agg = self.rebuild_aggregates(user_id)
+                if agg is None or self.repo.insert_aggregates(agg.to_row()):
+                    return agg
+                continue        # lost to a concurrent rebuild: fold into its row instead
+            if trade_id is not None and agg.rebuilt_through is not None and trade_id <= agg.rebuilt_through:
+                return agg
+            expected = agg.updated_at
+            agg.add(score, tag_codes)
+            if self.repo.replace_aggregates(agg.to_row(), expected):
+                return agg
+        # Dropping the row for a rebuild here would race the other writers'
+        # rebuilds; the audit itself is saved, only the running totals miss it
+        log.error("aggregates for %s kept changing underneath; trade %s not counted", user_id, trade_id)
+        return None
@@ -0,0 +1,67 @@
+"""
+First stage of Chart Vision: a local layout heuristic that tells a
+portfolio table from a single-trade price chart, so the model gets the
+short specialized prompt (prompts.CHART_PROMPTS_BY_TYPE) instead of the
+combined one that asks it to decide first.
+
+Runs on a small grayscale / colour thumbnail in a few milliseconds:
+
+    text bands   - runs of rows full of sharp left-right transitions that
+                   are text-line high. A holdings list has one per row.
+    candle cols  - share of columns holding saturated red / green pixels.
+                   Candles (and volume bars) spread across the plot; P/L
+                   text in a table sits in one or two columns.
+
+Anything that is not clearly one or the other returns None and keeps the
+combined prompt, so a wrong guess costs nothing over today.
+"""
+import base64
+import io
+
+import numpy as np
+
+PORTFOLIO_IMAGE = "portfolio"
+TRADE_IMAGE = "trade"
+
+THUMBNAIL_SIZE = (320, 320)
+EDGE_STEP = 40              # gray-level jump that counts as a transition
+TEXT_ROW_ACTIVITY = 0.04    # share of a row's pixels that are transitions
+MAX_TEXT_BAND = 0.06        # taller runs are plot area, not a text line (share of height)
+SATURATION = 60             # red / green channel lead over the other two
+
+MIN_PORTFOLIO_BANDS = 8
+MAX_PORTFOLIO_CANDLE_COLS = 0.35
+MIN_TRADE_CANDLE_COLS = 0.4
+
+def _runs(mask):
+    """Lengths of the runs of True in a 1-d bool array"""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges[1::2] - edges[::2]
+
+def layout_features(img_b64):
+    """{"text_bands", "candle_cols"} of a base64 image (see module docstring)"""
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(base64.b64decode(img_b64))).convert("RGB")
+    image.thumbnail(THUMBNAIL_SIZE)
+    rgb = np.asarray(image, dtype=np.int16)
+    height = rgb.shape[0]
+
+    gray = rgb.mean(axis=2)
+    activity = (np.abs(np.diff(gray, axis=1)) > EDGE_STEP).mean(axis=1)
+    runs = _runs(activity > TEXT_ROW_ACTIVITY)
+    text_bands = int(((runs >= 2) & (runs <= max(3, height * MAX_TEXT_BAND))).sum())
+
+    red, green, blue = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    colored = (green - np.maximum(red, blue) > SATURATION) | (red - np.maximum(green, blue) > SATURATION)
+    return {"text_bands": text_bands, "candle_cols": float(colored.any(axis=0).mean())}
+
+def classify_image(img_b64):
+    """PORTFOLIO_IMAGE, TRADE_IMAGE, or None when the layout is ambiguous"""
+    features = layout_features(img_b64)
+    if features["candle_cols"] >= MIN_TRADE_CANDLE_COLS and features["text_bands"] < MIN_PORTFOLIO_BANDS:
+        return TRADE_IMAGE
+    if features["text_bands"] >= MIN_PORTFOLIO_BANDS and features["candle_cols"] <= MAX_PORTFOLIO_CANDLE_COLS:
+        return PORTFOLIO_IMAGE
+    return None
@@ -0,0 +1,211 @@
+"""
+Chat-completions client for the inference router.
+
+InferenceClient wraps the HTTP calls the app used to make inline: a single
+text/image completion (complete) and the retrying vision call with the
+response-quality guard rails (vision). Prompts arrive pre-split by the
+template registry (prompts.py): the static `system` prefix goes first as
+its own message so the router can reuse its cached prefix, the request's
+data last. Completions are streamed, so the time to the first chunk is
+the real time to first token. Both return (content, meta), where meta
+carries model id, token usage (summed over retried attempts), finish
+reason, image size, time to first token, latency and attempt count for
+AuditEngine.save and the inference log. A failed call raises
+InferenceError with whatever meta was known at that point.
+
+User-facing retry notices go through the optional `notify` callback
+(st.warning in the app, a logger elsewhere).
+"""
+import json
+import time
+
+import requests
+
+MODEL_ID = "Qwen/Qwen2.5-VL-7B-Instruct"
+DEFAULT_API_URL = "https://router.huggingface.co/v1/chat/completions"
+
+MODEL_LOADING_WAIT_S = 20           # router returns 503 while the model spins up
+
+class InferenceError(Exception):
+    def __init__(self, message, meta=None):
+        super().__init__(message)
+        self.meta = meta or {}
+
+def image_bytes(img_b64):
+    """Decoded size of a base64 image (None without one)"""
+    if not img_b64:
+        return None
+    return len(img_b64) * 3 // 4 - img_b64[-2:].count("=")
+
+def _elapsed_ms(started_at):
+    return int((time.perf_counter() - started_at) * 1000)
+
+def read_body(res, started_at):
+    """
+    (body, ttfb_ms) of a router response. A streamed completion (server-sent
+    events) is drained into the shape a non-streamed body has, and timed at
+    its first chunk; anything else is read as plain JSON, with no TTFB.
+    """
+    if res.status_code != 200 or not res.headers.get("content-type", "").startswith("text/event-stream"):
+        try:
+            return res.json(), None
+        except ValueError:
+            return {}, None
+    body, parts, ttfb_ms = {}, [], None
+    for line in res.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            break
+        if ttfb_ms is None:
+            ttfb_ms = _elapsed_ms(started_at)
+        chunk = json.loads(data)
+        body["model"] = chunk.get("model") or body.get("model")
+        # Usage arrives on the last chunk (stream_options.include_usage)
+        if chunk.get("usage"):
+            body["usage"] = chunk["usage"]
+        for choice in chunk.get("choices") or []:
+            parts.append((choice.get("delta") or {}).get("content") or "")
+            if choice.get("finish_reason"):
+                body["finish_reason"] = choice["finish_reason"]
+    body["choices"] = [{"message": {"content": "".join(parts)}, "finish_reason": body.pop("finish_reason", None)}]
+    return body, ttfb_ms
+
+def _add_tokens(count, earlier):
+    return None if count is None and earlier is None else (count or 0) + (earlier or 0)
+
+def completion_metadata(body, started_at, attempts=1, model_id=MODEL_ID, img_b64=None, ttfb_ms=None,
+                        spent=None):
+    """
+    Collect model id, token usage and timings from a router response body.
+    spent is the meta of earlier attempts of the same call; their tokens
+    were billed too, so they are added on.
+    """
+    usage = body.get("usage") or {}
+    choices = body.get("choices") or [{}]
+    spent = spent or {}
+    return {
+        "model_id": body.get("model") or model_id,
+        "prompt_tokens": _add_tokens(usage.get("prompt_tokens"), spent.get("prompt_tokens")),
+        "completion_tokens": _add_tokens(usage.get("completion_tokens"), spent.get("completion_tokens")),
+        # "stop" (stop sequence / end of turn) or "length" (hit max_tokens)
+        "finish_reason": choices[0].get("finish_reason"),
+        "ttfb_ms": ttfb_ms,
+        "latency_ms": _elapsed_ms(started_at),
+        "image_bytes": image_bytes(img_b64),
+        "attempts": attempts
+    }
+
+def build_messages(prompt, img_b64=None, system=None):
+    content = [{"type": "text", "text": prompt}]
+    if img_b64:
+        content.append({"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_b64}"}})
+    messages = [{"role": "system", "content": system}] if system else []
+    return messages + [{"role": "user", "content": content}]
+
+class InferenceClient:
+    def __init__(self, token, api_url=DEFAULT_API_URL, model_id=MODEL_ID, session=None, notify=None):
+        self.token = token
+        self.api_url = api_url
+        self.model_id = model_id
+        self.session = session or requests.Session()
+        self.notify = notify or (lambda message: None)
+
+    def _post(self, payload, timeout):
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json"
+        }
+        payload = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+        return self.session.post(self.api_url, headers=headers, json=payload, timeout=timeout, stream=True)
+
+    def complete(self, prompt, img_b64=None, system=None, max_tokens=1500, temperature=0.3, timeout=60, **params):
+        """One completion, no retries - raises InferenceError on a non-200"""
+        payload = {
+            "model": self.model_id,
+            "messages": build_messages(prompt, img_b64, system),
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            **params
+        }
+        started_at = time.perf_counter()
+        res = self._post(payload, timeout)
+        body, ttfb_ms = read_body(res, started_at)
+        meta = completion_metadata(body, started_at, model_id=self.model_id, img_b64=img_b64, ttfb_ms=ttfb_ms)
+        if res.status_code != 200:
+            raise InferenceError(f"API Error: {res.status_code} - {res.text[:200]}", meta)
+        content = body["choices"][0]["message"]["content"]
+        return content, meta
+
+    def vision(self, prompt, img_b64, system=None, max_retries=3, max_tokens=2500, temperature=0.15, timeout=120,
+               stop=None):
+        """
+        Vision call with retries on code / section-less responses. The
+        anti-hallucination number-reading instructions come with the
+        template's system prefix (prompts.IMAGE_READING_INSTRUCTIONS).
+        """
+        started_at = time.perf_counter()
+        spent = {}          # tokens billed by attempts that were retried
+        for attempt in range(max_retries):
+            try:
+                payload = {
+                    "model": self.model_id,
+                    "messages": build_messages(prompt, img_b64, system),
+                    "max_tokens": max_tokens,
+                    "temperature": temperature,
+                    "top_p": 0.9
+                }
+                if stop:
+                    payload["stop"] = stop
+                attempt_started_at = time.perf_counter()
+                res = self._post(payload, timeout)
+                body, ttfb_ms = read_body(res, attempt_started_at)
+                meta = completion_metadata(body, started_at, attempt + 1, self.model_id, img_b64, ttfb_ms, spent)
+
+                if res.status_code == 200:
+                    content = body["choices"][0]["message"]["content"]
+
+                    # FIX 7: Validate response quality
+                    # Check if response is just code or HTML
+                    if '<div' in content or '<html' in content or '```python' in content[:100]:
+                        if attempt < max_retries - 1:
+                            spent = meta
+                            continue  # Retry
+                        raise InferenceError("Model returning code instead of analysis", meta)
+
+                    # Check if response has at least some of the expected sections
+                    required_sections = ['SCORE', 'TECH', 'PSYCH', 'RISK']
+                    sections_found = sum(1 for section in required_sections if f'[{section}]' in content.upper())
+
+                    if sections_found < 2:  # Need at least 2 sections
+                        if attempt < max_retries - 1:
+                            spent = meta
+                            continue
+                        # Still return it, but warn
+                        self.notify(f"⚠️ AI response may be incomplete (only {sections_found}/4 sections found).")
+
+                    return content, meta
+
+                elif res.status_code == 503:
+                    self.notify(f"🔄 Model is loading... (Attempt {attempt + 1}/{max_retries})")
+                    if attempt < max_retries - 1:
+                        time.sleep(MODEL_LOADING_WAIT_S)
+                        continue
+                else:
+                    raise InferenceError(f"API returned {res.status_code}: {res.text[:200]}", meta)
+
+            except Exception:
+                if attempt == max_retries - 1:
+                    raise
+                self.notify(f"⚠️ Attempt {attempt + 1} failed, retrying...")
+                continue
+
+        raise InferenceError("Max retries exceeded", {
+            "model_id": self.model_id,
+            "prompt_tokens": spent.get("prompt_tokens"),
+            "completion_tokens": spent.get("completion_tokens"),
+            "latency_ms": _elapsed_ms(started_at),
+            "image_bytes": image_bytes(img_b64),
+            "attempts": max_retries
+        })
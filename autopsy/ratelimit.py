@@ -0,0 +1,257 @@
+"""
+Per-user and global rate limiting for inference.
+
+Every audit goes through the job queue, so that is where the limits live:
+
+    per user  - token bucket (burst + sustained rate) and a daily quota,
+                both set by the user's plan tier. Checked when a job is
+                submitted; over the limit the submit is rejected with a
+                retry-after (HTTP 429 in the API, a notice in the UI).
+    global    - one token bucket for the shared HF_TOKEN. Checked by the
+                queue workers before they claim a job; when it is empty,
+                jobs simply wait in the queue.
+
+State lives in SQLite (the jobs database by default), so the Streamlit
+server and every gunicorn worker on the host share the same buckets.
+Allowed / throttled / over-quota / deferred decisions are counted per
+bucket:
+
+    python -m autopsy.ratelimit stats [--db data/jobs.db]
+"""
+import argparse
+import math
+import os
+import sqlite3
+import time
+from collections.abc import Mapping
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from .jobs import DEFAULT_JOBS_DB_PATH, FREE, PAID
+
+@dataclass(frozen=True)
+class PlanTier:
+    name: str
+    per_minute: float       # sustained audits per minute (bucket refill rate)
+    burst: int              # audits allowed back to back (bucket size)
+    daily_quota: int        # audits per UTC day
+    priority: str = FREE    # jobs.PRIORITY_CLASSES class of interactive audits
+
+PLAN_TIERS = {
+    "free": PlanTier("Free", per_minute=1, burst=3, daily_quota=10),
+    "pro": PlanTier("Pro", per_minute=4, burst=6, daily_quota=100, priority=PAID),
+    "desk": PlanTier("Desk", per_minute=20, burst=30, daily_quota=2000, priority=PAID),
+}
+DEFAULT_PLAN = "free"
+
+# Shared router budget across all users
+GLOBAL_PER_MINUTE = 60
+GLOBAL_BURST = 20
+
+ALLOWED, THROTTLED, OVER_QUOTA, DEFERRED = "allowed", "throttled", "over_quota", "deferred"
+
+_RATE_SCHEMA = """
+create table if not exists rate_buckets (
+    key         text primary key,
+    tokens      real not null,
+    updated_at  real not null
+);
+create table if not exists rate_quota (
+    user_id  text not null,
+    day      text not null,
+    used     integer not null default 0,
+    primary key (user_id, day)
+);
+create table if not exists rate_metrics (
+    key      text not null,
+    outcome  text not null,
+    count    integer not null default 0,
+    last_at  text,
+    primary key (key, outcome)
+);
+"""
+
+class RateLimited(Exception):
+    """Submit rejected; retry_after is in seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def parse_user_plans(value):
+    """USER_PLANS config - a mapping or "user_a:pro,user_b:desk" - to {user_id: plan}"""
+    if isinstance(value, Mapping):      # a [USER_PLANS] table in secrets.toml
+        return {str(k): str(v).lower() for k, v in value.items()}
+    plans = {}
+    for pair in (value or "").split(","):
+        user_id, sep, plan = pair.strip().partition(":")
+        if sep and user_id and plan:
+            plans[user_id.strip()] = plan.strip().lower()
+    return plans
+
+def _seconds_to_midnight_utc(now):
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (tomorrow - now).total_seconds()
+
+class RateLimiter:
+    def __init__(self, path=DEFAULT_JOBS_DB_PATH, user_plans=None,
+                 global_per_minute=GLOBAL_PER_MINUTE, global_burst=GLOBAL_BURST):
+        self.path = path
+        self.user_plans = user_plans or {}
+        self.global_rate = global_per_minute / 60
+        self.global_burst = global_burst
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("pragma journal_mode=wal")
+            conn.executescript(_RATE_SCHEMA)
+
+    @classmethod
+    def from_config(cls, config, path):
+        """Build from st.secrets / os.environ (USER_PLANS, GLOBAL_AUDITS_PER_MINUTE, GLOBAL_AUDIT_BURST)"""
+        return cls(
+            path,
+            user_plans=parse_user_plans(config.get("USER_PLANS")),
+            global_per_minute=float(config.get("GLOBAL_AUDITS_PER_MINUTE") or GLOBAL_PER_MINUTE),
+            global_burst=int(config.get("GLOBAL_AUDIT_BURST") or GLOBAL_BURST),
+        )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def tier_for(self, user_id):
+        return PLAN_TIERS.get(self.user_plans.get(user_id, DEFAULT_PLAN), PLAN_TIERS[DEFAULT_PLAN])
+
+    # --- bucket primitives (caller holds a write transaction) ---
+    @staticmethod
+    def _refill(conn, key, rate, capacity, now):
+        row = conn.execute("select tokens, updated_at from rate_buckets where key = ?", [key]).fetchone()
+        if row is None:
+            return float(capacity)
+        return min(capacity, row["tokens"] + (now - row["updated_at"]) * rate)
+
+    @staticmethod
+    def _store(conn, key, tokens, now):
+        conn.execute(
+            "insert into rate_buckets (key, tokens, updated_at) values (?, ?, ?) "
+            "on conflict(key) do update set tokens = excluded.tokens, updated_at = excluded.updated_at",
+            [key, tokens, now],
+        )
+
+    def _take(self, conn, key, rate, capacity, now):
+        """(taken, seconds until a token is available)"""
+        tokens = self._refill(conn, key, rate, capacity, now)
+        if tokens >= 1:
+            self._store(conn, key, tokens - 1, now)
+            return True, 0.0
+        self._store(conn, key, tokens, now)
+        return False, (1 - tokens) / rate
+
+    @staticmethod
+    def _count(conn, key, outcome):
+        conn.execute(
+            "insert into rate_metrics (key, outcome, count, last_at) values (?, ?, 1, ?) "
+            "on conflict(key, outcome) do update set count = count + 1, last_at = excluded.last_at",
+            [key, outcome, datetime.now(timezone.utc).isoformat()],
+        )
+
+    # --- per user (submit time) ---
+    def admit(self, user_id, count=1):
+        """
+        Charge a submit to the user's bucket and `count` audits to their
+        daily quota (a bulk import is one submit), or raise RateLimited
+        """
+        tier = self.tier_for(user_id)
+        now = datetime.now(timezone.utc)
+        key = f"user:{user_id}"
+        with self._connect() as conn:
+            conn.execute("begin immediate")
+            row = conn.execute(
+                "select used from rate_quota where user_id = ? and day = ?", [user_id, now.date().isoformat()]
+            ).fetchone()
+            used = row["used"] if row else 0
+            if used + count > tier.daily_quota:
+                self._count(conn, key, OVER_QUOTA)
+                rejected = RateLimited(
+                    f"Daily limit reached: {used} of {tier.daily_quota} audits used on the {tier.name} plan"
+                    f"{f', {count} requested' if count > 1 else ''}. Resets at 00:00 UTC.",
+                    _seconds_to_midnight_utc(now),
+                )
+            else:
+                taken, wait = self._take(conn, key, tier.per_minute / 60, tier.burst, now.timestamp())
+                if taken:
+                    conn.execute(
+                        "insert into rate_quota (user_id, day, used) values (?, ?, ?) "
+                        "on conflict(user_id, day) do update set used = used + excluded.used",
+                        [user_id, now.date().isoformat(), count],
+                    )
+                    self._count(conn, key, ALLOWED)
+                    return
+                self._count(conn, key, THROTTLED)
+                rejected = RateLimited(
+                    f"Too many audits in a row: next one in {math.ceil(wait)}s "
+                    f"({tier.name} plan: {tier.burst} back to back, then {tier.per_minute:g}/min).",
+                    wait,
+                )
+        raise rejected     # after the with-block, so the metric is committed
+
+    def usage(self, user_id):
+        tier = self.tier_for(user_id)
+        today = datetime.now(timezone.utc).date().isoformat()
+        with self._connect() as conn:
+            row = conn.execute("select used from rate_quota where user_id = ? and day = ?", [user_id, today]).fetchone()
+            tokens = self._refill(conn, f"user:{user_id}", tier.per_minute / 60, tier.burst, time.time())
+        return {"plan": tier.name, "used_today": row["used"] if row else 0,
+                "daily_quota": tier.daily_quota, "burst_available": int(tokens)}
+
+    # --- global (worker side) ---
+    def acquire_global(self):
+        """Take a token from the shared router budget: (ok, seconds to wait)"""
+        with self._connect() as conn:
+            conn.execute("begin immediate")
+            taken, wait = self._take(conn, "global", self.global_rate, self.global_burst, time.time())
+            self._count(conn, "global", ALLOWED if taken else DEFERRED)
+        return taken, wait
+
+    def refund_global(self):
+        """Return a token taken for a job another worker claimed first"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("begin immediate")
+            tokens = self._refill(conn, "global", self.global_rate, self.global_burst, now)
+            self._store(conn, "global", min(self.global_burst, tokens + 1), now)
+            conn.execute(
+                "update rate_metrics set count = count - 1 where key = 'global' and outcome = ?", [ALLOWED]
+            )
+
+    def stats(self):
+        """{bucket key: {outcome: count}}"""
+        out = {}
+        with self._connect() as conn:
+            for row in conn.execute("select key, outcome, count from rate_metrics order by key"):
+                out.setdefault(row["key"], {})[row["outcome"]] = row["count"]
+        return out
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m autopsy.ratelimit", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    stats = sub.add_parser("stats", help="allowed / throttled / over-quota / deferred counts per bucket")
+    stats.add_argument("--db", default=os.environ.get("JOBS_DB_PATH") or DEFAULT_JOBS_DB_PATH)
+    args = parser.parse_args(argv)
+
+    outcomes = (ALLOWED, THROTTLED, OVER_QUOTA, DEFERRED)
+    print(f"{'bucket':<28}" + "".join(f"{o:>12}" for o in outcomes))
+    for key, counts in RateLimiter(args.db).stats().items():
+        print(f"{key:<28}" + "".join(f"{counts.get(o, 0):>12,}" for o in outcomes))
+
+if __name__ == "__main__":
+    main()
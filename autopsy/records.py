@@ -0,0 +1,45 @@
+"""
+Mapping between parse_report output and the `trades` table columns.
+"""
+
+# parse_report key -> trades column
+REPORT_COLUMNS = {
+    "score": "score",
+    "tags": "mistake_tags",
+    "tag_codes": "mistake_tag_codes",
+    "tech": "technical_analysis",
+    "psych": "psych_analysis",
+    "risk": "risk_analysis",
+    "fix": "fix_action",
+    "overall_grade": "overall_grade",
+    "entry_quality": "entry_quality",
+    "exit_quality": "exit_quality",
+    "risk_score": "risk_score",
+    "strength": "strength",
+    "critical_error": "critical_error",
+    "trade_state": "trade_state",
+}
+
+REPORT_DEFAULTS = {
+    "score": 50,
+    "tags": [],
+    "tag_codes": [],
+    "tech": "",
+    "psych": "",
+    "risk": "",
+    "fix": "",
+    "overall_grade": "C",
+    "entry_quality": 50,
+    "exit_quality": 50,
+    "risk_score": 50,
+    "strength": "",
+    "critical_error": "",
+    "trade_state": "UNKNOWN",
+}
+
+def report_to_columns(report):
+    """Translate a parsed report into trades column values"""
+    return {
+        column: report.get(key, REPORT_DEFAULTS[key])
+        for key, column in REPORT_COLUMNS.items()
+    }
@@ -0,0 +1,132 @@
+"""
+Process-wide resource registry.
+
+Streamlit re-executes app.py on every rerun of every session, so anything
+built at module level (database client, HTTP session, parsed secrets) would
+be rebuilt each time. The app holds a single ResourceRegistry (via
+st.cache_resource). Each resource is built lazily on first use and shared by
+all session threads. It is health-checked at most every `check_interval`
+seconds and rebuilt if the check fails.
+
+    registry = ResourceRegistry()
+    registry.register("repo", lambda: create_repository(config), health_check=lambda r: r.ping())
+    repo = registry.get("repo")
+    registry.stats()    # {"repo": {"builds": 1, "uses": 42, ...}, ...}
+"""
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HTTP_POOL_SIZE = 16             # keep-alive connections per host
+
+class _Entry:
+    def __init__(self, factory, health_check, check_interval, describe):
+        self.factory = factory
+        self.health_check = health_check
+        self.check_interval = check_interval
+        self.describe = describe
+        self.lock = threading.Lock()
+        self.value = None
+        self.built = False
+        self.built_at = None
+        self.checked_at = 0.0
+        self.builds = 0
+        self.uses = 0
+        self.failed_checks = 0
+        self.last_error = None
+
+class ResourceRegistry:
+    """Lazily built, health-checked singletons shared across sessions"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def register(self, name, factory, health_check=None, check_interval=60, describe=None):
+        """
+        factory() builds the resource; health_check(value) raises or returns
+        False when it must be rebuilt; describe(value) adds pool statistics.
+        Re-registering a name replaces the entry.
+        """
+        with self._lock:
+            self._entries[name] = _Entry(factory, health_check, check_interval, describe)
+
+    def get(self, name):
+        entry = self._entries[name]
+        with entry.lock:
+            if entry.built and self._due_for_check(entry) and not self._healthy(entry):
+                entry.built = False
+            if not entry.built:
+                self._build(entry)
+            entry.uses += 1
+            return entry.value
+
+    def invalidate(self, name):
+        """Force a rebuild on next get() (e.g. after a connection error)"""
+        entry = self._entries[name]
+        with entry.lock:
+            entry.built = False
+
+    def stats(self):
+        out = {}
+        for name, entry in list(self._entries.items()):
+            with entry.lock:
+                info = {
+                    "built": entry.built,
+                    "builds": entry.builds,
+                    "uses": entry.uses,
+                    "failed_checks": entry.failed_checks,
+                    "age_s": round(time.time() - entry.built_at, 1) if entry.built else None,
+                    "last_error": entry.last_error,
+                }
+                if entry.built and entry.describe and entry.value is not None:
+                    info.update(entry.describe(entry.value))
+            out[name] = info
+        return out
+
+    # --- internals (entry.lock held) ---
+    @staticmethod
+    def _due_for_check(entry):
+        return entry.health_check is not None and time.time() - entry.checked_at >= entry.check_interval
+
+    @staticmethod
+    def _healthy(entry):
+        entry.checked_at = time.time()
+        try:
+            ok = entry.health_check(entry.value) is not False
+        except Exception as e:
+            ok = False
+            entry.last_error = f"{type(e).__name__}: {e}"
+        if not ok:
+            entry.failed_checks += 1
+        return ok
+
+    @staticmethod
+    def _build(entry):
+        entry.value = entry.factory()
+        entry.built = True
+        entry.built_at = entry.checked_at = time.time()
+        entry.builds += 1
+
+def create_http_session(pool_size=HTTP_POOL_SIZE):
+    """requests.Session with a keep-alive pool sized for concurrent sessions"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def describe_http_session(session):
+    """Open pools / connections for ResourceRegistry.stats()"""
+    pools = connections = requests_made = 0
+    for adapter in set(session.adapters.values()):
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            pools += 1
+            connections += pool.num_connections
+            requests_made += pool.num_requests
+    return {"http_pools": pools, "http_connections": connections, "http_requests": requests_made}
@@ -0,0 +1,477 @@
+"""
+Storage backends behind save_analysis, the history queries, the
+per-user aggregates and the inference log.
+
+    SupabaseRepository  - hosted Postgres via the Supabase client
+    SQLiteRepository    - embedded single-file database (offline-first cache,
+                          single-node deployments, load tests without a
+                          live service)
+
+create_repository() picks one from config (st.secrets or os.environ):
+
+    STORAGE_BACKEND = "supabase" | "sqlite"    (default: supabase when
+                                                SUPABASE_URL/KEY are set,
+                                                otherwise none)
+    LOCAL_DB_PATH   = "data/trade_autopsy.db"
+
+storage_target() names the database a config writes to; job rows carry
+it so a worker only runs jobs whose results land where the submitter
+reads them.
+"""
+import json
+import os
+import sqlite3
+from collections import defaultdict
+from contextlib import contextmanager
+
+DEFAULT_LOCAL_DB_PATH = "data/trade_autopsy.db"
+
+# Column projections for the Performance Metrics tab. The analysis prose
+# (kilobytes per row) is never needed there, so it is never fetched.
+SCORE_SERIES_COLUMNS = ("created_at", "score", "mistake_tag_codes")
+RECENT_ACTIVITY_COLUMNS = ("created_at", "ticker", "score", "mistake_tags")
+RECENT_ACTIVITY_LIMIT = 10
+# Data Vault grid and CSV export: the trades columns it has always shown,
+# without the raw completion and the structured-result / telemetry columns
+VAULT_COLUMNS = ("id", "created_at", "user_id", "ticker", "score", "mistake_tags",
+                 "technical_analysis", "psych_analysis", "risk_analysis", "fix_action")
+
+HISTORY_PAGE = 1000
+INFERENCE_LOG_PAGE = 1000
+
+class TradeRepository:
+    """Interface every backend implements"""
+
+    name = "base"
+
+    def ping(self):
+        """Cheap round-trip used by the resource registry's health check"""
+        raise NotImplementedError
+
+    def insert_trade(self, row):
+        """Insert one audit; returns its trades.id"""
+        raise NotImplementedError
+
+    def fetch_history(self, user_id, columns=None, limit=None, newest_first=True):
+        """List of row dicts for one user; columns=None means all columns"""
+        raise NotImplementedError
+
+    def fetch_score_series(self, user_id):
+        """Newest-first created_at / score / tags for the evolution chart and insights"""
+        return self.fetch_history(user_id, columns=SCORE_SERIES_COLUMNS)
+
+    def fetch_recent_activity(self, user_id, limit=RECENT_ACTIVITY_LIMIT):
+        """Last few audits for the Recent Activity table"""
+        return self.fetch_history(user_id, columns=RECENT_ACTIVITY_COLUMNS, limit=limit)
+
+    def fetch_aggregates(self, user_id):
+        """The user_aggregates row as a dict, or None"""
+        raise NotImplementedError
+
+    def insert_aggregates(self, row):
+        """Insert a rebuilt row unless one exists; True when inserted"""
+        raise NotImplementedError
+
+    def replace_aggregates(self, row, expected_updated_at):
+        """
+        Overwrite the user's row only if its updated_at is still
+        expected_updated_at (compare-and-set); True when written
+        """
+        raise NotImplementedError
+
+    def delete_aggregates(self, user_ids):
+        """Drop the users' rows; the next load_aggregates rebuilds them from history"""
+        raise NotImplementedError
+
+    def iter_trades(self, columns, chunk_size):
+        """Yield chunks of trades rows, ordered by id (the backfill scan)"""
+        raise NotImplementedError
+
+    def bulk_update(self, rows):
+        """Write partial rows ({"id": ..., <changed columns>}) back by id"""
+        raise NotImplementedError
+
+    def insert_inference_log(self, row):
+        """One model call: tokens, image size, attempts, timings (see telemetry.py)"""
+        raise NotImplementedError
+
+    def fetch_inference_log(self, since, columns=None):
+        """inference_log rows created at or after `since` (ISO-8601), oldest first"""
+        raise NotImplementedError
+
+# ==========================================
+# SUPABASE
+# ==========================================
+class SupabaseRepository(TradeRepository):
+    name = "supabase"
+
+    def __init__(self, client):
+        self.client = client
+
+    def ping(self):
+        self.client.table("trades").select("id").limit(1).execute()
+        return True
+
+    def insert_trade(self, row):
+        res = self.client.table("trades").insert(row).execute()
+        return res.data[0]["id"] if res.data else None
+
+    def fetch_history(self, user_id, columns=None, limit=None, newest_first=True):
+        rows, offset = [], 0
+        while True:
+            # PostgREST caps each response, so page until limit (or the end)
+            page = HISTORY_PAGE if not limit else min(HISTORY_PAGE, limit - offset)
+            res = (
+                self.client.table("trades")
+                .select(",".join(columns) if columns else "*")
+                .eq("user_id", user_id)
+                .order("created_at", desc=newest_first)
+                .order("id", desc=newest_first)
+                .range(offset, offset + page - 1)
+                .execute()
+            )
+            rows.extend(res.data or [])
+            offset += page
+            if len(res.data or []) < page or (limit and offset >= limit):
+                return rows
+
+    def fetch_aggregates(self, user_id):
+        res = self.client.table("user_aggregates").select("*").eq("user_id", user_id).limit(1).execute()
+        return res.data[0] if res.data else None
+
+    def insert_aggregates(self, row):
+        res = (
+            self.client.table("user_aggregates")
+            .upsert(row, on_conflict="user_id", ignore_duplicates=True)
+            .execute()
+        )
+        return bool(res.data)
+
+    def replace_aggregates(self, row, expected_updated_at):
+        query = self.client.table("user_aggregates").update(row).eq("user_id", row["user_id"])
+        if expected_updated_at is None:
+            query = query.is_("updated_at", "null")
+        else:
+            query = query.eq("updated_at", expected_updated_at)
+        return bool(query.execute().data)
+
+    def delete_aggregates(self, user_ids):
+        if user_ids:
+            self.client.table("user_aggregates").delete().in_("user_id", list(user_ids)).execute()
+
+    def iter_trades(self, columns, chunk_size):
+        last_id = 0
+        while True:
+            res = (
+                self.client.table("trades")
+                .select(",".join(columns))
+                .gt("id", last_id)
+                .order("id")
+                .limit(chunk_size)
+                .execute()
+            )
+            if not res.data:
+                return
+            yield res.data
+            last_id = res.data[-1]["id"]
+
+    def bulk_update(self, rows):
+        # Upsert batches need a uniform shape, so group by changed columns.
+        # Rows must carry user_id so the insert half of the upsert is valid.
+        for batch in _group_by_shape(rows).values():
+            self.client.table("trades").upsert(batch, on_conflict="id").execute()
+
+    def insert_inference_log(self, row):
+        self.client.table("inference_log").insert(row).execute()
+
+    def fetch_inference_log(self, since, columns=None):
+        rows, offset = [], 0
+        while True:
+            # PostgREST caps each response, so page through the window
+            res = (
+                self.client.table("inference_log")
+                .select(",".join(columns) if columns else "*")
+                .gte("created_at", since)
+                .order("created_at")
+                .range(offset, offset + INFERENCE_LOG_PAGE - 1)
+                .execute()
+            )
+            rows.extend(res.data or [])
+            if len(res.data or []) < INFERENCE_LOG_PAGE:
+                return rows
+            offset += INFERENCE_LOG_PAGE
+
+# ==========================================
+# SQLITE
+# ==========================================
+_SQLITE_SCHEMA = """
+create table if not exists trades (
+    id                 integer primary key autoincrement,
+    created_at         text not null default (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+    user_id            text not null,
+    ticker             text,
+    score              integer,
+    mistake_tags       text default '[]',
+    mistake_tag_codes  text,
+    technical_analysis text,
+    psych_analysis     text,
+    risk_analysis      text,
+    fix_action         text,
+    overall_grade      text,
+    entry_quality      integer,
+    exit_quality       integer,
+    risk_score         integer,
+    strength           text,
+    critical_error     text,
+    trade_state        text default 'UNKNOWN',
+    analysis_mode      text,
+    raw_response       text,
+    model_id           text,
+    prompt_version     text,
+    parser_version     text,
+    prompt_tokens      integer,
+    completion_tokens  integer,
+    latency_ms         integer
+);
+create index if not exists trades_user_created_idx on trades (user_id, created_at);
+
+create table if not exists user_aggregates (
+    user_id        text primary key,
+    total_audits   integer not null default 0,
+    score_sum      integer not null default 0,
+    quality_count  integer not null default 0,
+    tag_counts     text not null default '{}',
+    band_counts    text not null default '[0,0,0,0]',
+    recent_scores  text not null default '[]',
+    behavior       text not null default '{}',
+    updated_at     text,
+    rebuilt_through integer
+);
+
+create table if not exists inference_log (
+    id                 integer primary key autoincrement,
+    created_at         text not null default (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+    user_id            text,
+    job_id             text,
+    mode               text,
+    prompt_version     text,
+    model_id           text,
+    status             text not null,
+    error              text,
+    prompt_tokens      integer,
+    completion_tokens  integer,
+    image_bytes        integer,
+    attempts           integer,
+    ttfb_ms            integer,
+    latency_ms         integer,
+    max_tokens         integer,
+    finish_reason      text
+);
+create index if not exists inference_log_created_idx on inference_log (created_at);
+"""
+
+# Columns added after a table first shipped: (table, column, definition).
+# Pre-existing local databases get them on open; see migrations/ for Postgres.
+_SQLITE_ADDED_COLUMNS = (
+    ("user_aggregates", "behavior", "text not null default '{}'"),
+    ("user_aggregates", "rebuilt_through", "integer"),
+    ("inference_log", "max_tokens", "integer"),
+    ("inference_log", "finish_reason", "text"),
+    ("inference_log", "ttfb_ms", "integer"),
+)
+
+# Columns stored as JSON text in SQLite (jsonb / arrays in Postgres)
+_JSON_COLUMNS = {
+    "trades": {"mistake_tags", "mistake_tag_codes"},
+    "user_aggregates": {"tag_counts", "band_counts", "recent_scores", "behavior"},
+}
+
+class SQLiteRepository(TradeRepository):
+    """
+    Embedded backend. A short-lived connection per call keeps it safe
+    across Streamlit's session threads; WAL lets readers run during writes.
+    """
+    name = "sqlite"
+
+    def __init__(self, path=DEFAULT_LOCAL_DB_PATH):
+        self.path = path
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("pragma journal_mode=wal")
+            conn.executescript(_SQLITE_SCHEMA)
+            self._add_missing_columns(conn)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:          # commit on success, rollback on error
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _add_missing_columns(conn):
+        for table, column, definition in _SQLITE_ADDED_COLUMNS:
+            existing = {r["name"] for r in conn.execute(f"pragma table_info({table})")}
+            if column not in existing:
+                conn.execute(f"alter table {table} add column {column} {definition}")
+                if table == "user_aggregates":
+                    # Aggregates are derived; drop them so they rebuild from history
+                    conn.execute("delete from user_aggregates")
+
+    @staticmethod
+    def _encode(table, row):
+        return {
+            k: json.dumps(v) if k in _JSON_COLUMNS[table] else v
+            for k, v in row.items()
+        }
+
+    @staticmethod
+    def _decode(table, row):
+        out = dict(row)
+        for k in _JSON_COLUMNS[table] & out.keys():
+            if out[k] is not None:
+                out[k] = json.loads(out[k])
+        return out
+
+    def ping(self):
+        with self._connect() as conn:
+            conn.execute("select 1")
+        return True
+
+    def insert_trade(self, row):
+        row = self._encode("trades", row)
+        cols = ", ".join(row)
+        marks = ", ".join("?" * len(row))
+        with self._connect() as conn:
+            return conn.execute(f"insert into trades ({cols}) values ({marks})", list(row.values())).lastrowid
+
+    def fetch_history(self, user_id, columns=None, limit=None, newest_first=True):
+        sql = (
+            f"select {', '.join(columns) if columns else '*'} from trades "
+            f"where user_id = ? order by created_at {'desc' if newest_first else 'asc'}, id {'desc' if newest_first else 'asc'}"
+        )
+        params = [user_id]
+        if limit:
+            sql += " limit ?"
+            params.append(limit)
+        with self._connect() as conn:
+            return [self._decode("trades", r) for r in conn.execute(sql, params)]
+
+    def fetch_aggregates(self, user_id):
+        with self._connect() as conn:
+            row = conn.execute("select * from user_aggregates where user_id = ?", [user_id]).fetchone()
+        return self._decode("user_aggregates", row) if row else None
+
+    def insert_aggregates(self, row):
+        row = self._encode("user_aggregates", row)
+        cols = ", ".join(row)
+        marks = ", ".join("?" * len(row))
+        with self._connect() as conn:
+            cur = conn.execute(
+                f"insert into user_aggregates ({cols}) values ({marks}) on conflict(user_id) do nothing",
+                list(row.values()),
+            )
+        return cur.rowcount == 1
+
+    def replace_aggregates(self, row, expected_updated_at):
+        row = self._encode("user_aggregates", row)
+        cols = [c for c in row if c != "user_id"]
+        sets = ", ".join(f"{c} = ?" for c in cols)
+        with self._connect() as conn:
+            cur = conn.execute(
+                f"update user_aggregates set {sets} where user_id = ? and updated_at is ?",
+                [row[c] for c in cols] + [row["user_id"], expected_updated_at],
+            )
+        return cur.rowcount == 1
+
+    def delete_aggregates(self, user_ids):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                f"delete from user_aggregates where user_id in ({', '.join('?' * len(user_ids))})",
+                user_ids,
+            )
+
+    def iter_trades(self, columns, chunk_size):
+        last_id = 0
+        sql = f"select {', '.join(columns)} from trades where id > ? order by id limit ?"
+        while True:
+            with self._connect() as conn:
+                rows = [self._decode("trades", r) for r in conn.execute(sql, [last_id, chunk_size])]
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1]["id"]
+
+    def bulk_update(self, rows):
+        with self._connect() as conn:
+            for shape, batch in _group_by_shape(rows).items():
+                cols = [c for c in shape if c not in ("id", "user_id")]
+                sets = ", ".join(f"{c} = ?" for c in cols)
+                conn.executemany(
+                    f"update trades set {sets} where id = ?",
+                    [[self._encode("trades", r)[c] for c in cols] + [r["id"]] for r in batch],
+                )
+
+    def insert_inference_log(self, row):
+        cols = ", ".join(row)
+        marks = ", ".join("?" * len(row))
+        with self._connect() as conn:
+            conn.execute(f"insert into inference_log ({cols}) values ({marks})", list(row.values()))
+
+    def fetch_inference_log(self, since, columns=None):
+        sql = (
+            f"select {', '.join(columns) if columns else '*'} from inference_log "
+            "where created_at >= ? order by created_at"
+        )
+        with self._connect() as conn:
+            return [dict(r) for r in conn.execute(sql, [since])]
+
+def _group_by_shape(rows):
+    groups = defaultdict(list)
+    for row in rows:
+        groups[tuple(sorted(row))].append(row)
+    return groups
+
+# ==========================================
+# FACTORY
+# ==========================================
+def create_repository(config):
+    """
+    Build the configured backend from a mapping (st.secrets / os.environ).
+    Returns None when nothing is configured.
+    """
+    backend = (config.get("STORAGE_BACKEND") or "").lower()
+    url, key = config.get("SUPABASE_URL"), config.get("SUPABASE_KEY")
+
+    if backend == "sqlite":
+        return SQLiteRepository(config.get("LOCAL_DB_PATH") or DEFAULT_LOCAL_DB_PATH)
+
+    if backend in ("", "supabase"):
+        if not (url and key):
+            if backend == "supabase":
+                raise ValueError("STORAGE_BACKEND=supabase requires SUPABASE_URL and SUPABASE_KEY")
+            return None
+        from supabase import create_client
+        return SupabaseRepository(create_client(url, key))
+
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend!r}")
+
+def storage_target(config):
+    """
+    "sqlite:<absolute path>" or "supabase:<project url>" for the backend
+    create_repository(config) would build (None when nothing is configured)
+    """
+    backend = (config.get("STORAGE_BACKEND") or "").lower()
+    if backend == "sqlite":
+        return "sqlite:" + os.path.abspath(config.get("LOCAL_DB_PATH") or DEFAULT_LOCAL_DB_PATH)
+    url = config.get("SUPABASE_URL")
+    if backend in ("", "supabase") and url:
+        return "supabase:" + url.rstrip("/")
+    return None
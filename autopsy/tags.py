@@ -0,0 +1,167 @@
+"""
+Canonical mistake-tag taxonomy.
+
+The model emits free-form tags ("No_Stops", "No stop loss", "Lack of stops",
+...). canonicalize_tag() maps each spelling onto a fixed taxonomy via an
+alias table, falling back to cached fuzzy matching. Tags are stored as
+small integer codes (index into TAXONOMY) alongside the raw text, so
+counting / filtering / co-occurrence run on compact integer arrays.
+
+Codes are append-only: never reorder or delete entries in TAXONOMY.
+"""
+import difflib
+import re
+from functools import lru_cache
+
+TAXONOMY = (
+    "Other",                            # 0 - unmatched tags
+    "FOMO",
+    "Revenge_Trading",
+    "Tilt",
+    "Panic_Selling",
+    "Emotional_Trading",
+    "No_Stops",
+    "Lack_Of_Exit_Plan",
+    "Exit_Failure",
+    "Hope_Based_Investing",
+    "Averaging_Down",
+    "Overleveraged",
+    "Position_Sizing_Failure",
+    "Concentration_Risk",
+    "Sector_Concentration",
+    "Over_Diversified",
+    "Portfolio_Crisis",
+    "Multiple_Catastrophic_Positions",
+    "Poor_Risk_Reward",
+    "Chasing_Entry",
+    "Premature_Exit",
+    "Overtrading",
+    "Good_Diversification",
+    "Disciplined_Stops",
+    "Disciplined_Execution",
+    "Lack_Of_Discipline",
+    "Poor_Entry_Timing",
+)
+
+CODES = {name: code for code, name in enumerate(TAXONOMY)}
+OTHER = CODES["Other"]
+FOMO = CODES["FOMO"]
+REVENGE = CODES["Revenge_Trading"]
+TILT = CODES["Tilt"]
+PANIC = CODES["Panic_Selling"]
+
+# Emotion-state tags (used by the behavioral analytics)
+EMOTION_CODES = frozenset({FOMO, REVENGE, TILT, PANIC, CODES["Emotional_Trading"]})
+
+# Normalized spelling -> canonical name (canonical names match themselves)
+ALIASES = {
+    "fear of missing out": "FOMO",
+    "fomo entry": "FOMO",
+    "fomo buying": "FOMO",
+    "revenge": "Revenge_Trading",
+    "revenge trade": "Revenge_Trading",
+    "on tilt": "Tilt",
+    "panic": "Panic_Selling",
+    "panic sell": "Panic_Selling",
+    "panic exit": "Panic_Selling",
+    "emotional": "Emotional_Trading",
+    "emotional decision": "Emotional_Trading",
+    "emotional entry": "Emotional_Trading",
+    "no stop": "No_Stops",
+    "no stop loss": "No_Stops",
+    "no stop losses": "No_Stops",
+    "no sl": "No_Stops",
+    "missing stop loss": "No_Stops",
+    "lack of stop loss": "No_Stops",
+    "lack of stops": "No_Stops",
+    "without stop loss": "No_Stops",
+    "no exit plan": "Lack_Of_Exit_Plan",
+    "no exit strategy": "Lack_Of_Exit_Plan",
+    "lack of exit strategy": "Lack_Of_Exit_Plan",
+    "poor exit": "Exit_Failure",
+    "late exit": "Exit_Failure",
+    "holding losers": "Hope_Based_Investing",
+    "hope trading": "Hope_Based_Investing",
+    "hope based holding": "Hope_Based_Investing",
+    "averaging down into losers": "Averaging_Down",
+    "over leveraged": "Overleveraged",
+    "leverage": "Overleveraged",
+    "excessive leverage": "Overleveraged",
+    "margin risk": "Overleveraged",
+    "oversized position": "Position_Sizing_Failure",
+    "poor position sizing": "Position_Sizing_Failure",
+    "position sizing": "Position_Sizing_Failure",
+    "concentration": "Concentration_Risk",
+    "over concentration": "Concentration_Risk",
+    "sector risk": "Sector_Concentration",
+    "overdiversified": "Over_Diversified",
+    "over diversification": "Over_Diversified",
+    "multiple losers": "Multiple_Catastrophic_Positions",
+    "catastrophic loss": "Portfolio_Crisis",
+    "poor rr": "Poor_Risk_Reward",
+    "poor r r": "Poor_Risk_Reward",
+    "bad risk reward": "Poor_Risk_Reward",
+    "chasing": "Chasing_Entry",
+    "chasing price": "Chasing_Entry",
+    "late entry": "Chasing_Entry",
+    "early exit": "Premature_Exit",
+    "cutting winners": "Premature_Exit",
+    "over trading": "Overtrading",
+    "diversified": "Good_Diversification",
+    "good stops": "Disciplined_Stops",
+    "disciplined": "Disciplined_Execution",
+    "no discipline": "Lack_Of_Discipline",
+    "undisciplined": "Lack_Of_Discipline",
+    "poor discipline": "Lack_Of_Discipline",
+    "lack of discipline": "Lack_Of_Discipline",
+    "bad timing": "Poor_Entry_Timing",
+    "poor timing": "Poor_Entry_Timing",
+    "poor entry": "Poor_Entry_Timing",
+    "bad entry": "Poor_Entry_Timing",
+    "good discipline": "Disciplined_Execution",
+}
+
+FUZZY_CUTOFF = 0.82
+
+def normalize(raw):
+    """'No_Stop-Loss ' -> 'no stop loss'"""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", str(raw).lower()).split())
+
+_LOOKUP = {normalize(name): name for name in TAXONOMY[1:]}
+_LOOKUP.update({normalize(alias): name for alias, name in ALIASES.items()})
+_LOOKUP_KEYS = tuple(_LOOKUP)
+
+@lru_cache(maxsize=4096)
+def canonicalize_tag(raw):
+    """Canonical taxonomy name for a raw model tag ('Other' if nothing matches)"""
+    key = normalize(raw)
+    if key in _LOOKUP:
+        return _LOOKUP[key]
+    match = difflib.get_close_matches(key, _LOOKUP_KEYS, n=1, cutoff=FUZZY_CUTOFF)
+    return _LOOKUP[match[0]] if match else "Other"
+
+def encode_tags(tags):
+    """Raw tag list -> de-duplicated list of taxonomy codes (order preserved)"""
+    codes = []
+    for tag in tags or []:
+        code = CODES[canonicalize_tag(tag)]
+        if code not in codes:
+            codes.append(code)
+    return codes
+
+def codes_missing(tag_codes, tags):
+    """
+    True when a trades row still needs encode_tags(mistake_tags): codes are
+    NULL (row pre-dates the taxonomy) or empty while raw tags exist (the
+    empty default an early migration gave those rows)
+    """
+    if not isinstance(tag_codes, (list, tuple)):
+        return True
+    return not tag_codes and bool(tags)
+
+def row_tag_codes(tag_codes, tags):
+    """A trades row's codes, encoded from its raw tags when they are missing"""
+    return encode_tags(tags) if codes_missing(tag_codes, tags) else tag_codes
+
+def decode_tags(codes):
+    return [TAXONOMY[c] if 0 <= c < len(TAXONOMY) else "Other" for c in codes or []]
@@ -0,0 +1,125 @@
+"""
+Rollups over the inference log (one row per model call, written by
+AuditEngine.log_inference).
+
+    rows = repo.fetch_inference_log(since_iso(days=7), columns=INFERENCE_LOG_COLUMNS)
+    rollup(rows, by="mode")      # one row per Chart Vision / Text / Portfolio
+    rollup(rows, by=None)        # a single "all" row
+
+Each group reports call volume, error rate, token usage, truncations,
+image size, attempts, median time to first token (streamed calls) and
+latency percentiles. Used by the admin view.
+
+The same log sizes each mode's output budget: CompletionBudgets gives
+AuditEngine a max_tokens per mode from the recent completion-length
+distribution (see completion_budgets).
+"""
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+INFERENCE_LOG_COLUMNS = ("created_at", "user_id", "mode", "prompt_version", "model_id", "status",
+                         "prompt_tokens", "completion_tokens", "image_bytes", "attempts",
+                         "ttfb_ms", "latency_ms", "max_tokens", "finish_reason")
+
+# Output budget: p99 completion length plus headroom, once a mode has
+# enough successful calls; below the floor sections start getting cut
+BUDGET_MIN_SAMPLES = 50
+BUDGET_PERCENTILE = 0.99
+BUDGET_HEADROOM = 1.2
+BUDGET_FLOOR = 600
+BUDGET_WINDOW_DAYS = 7
+# More cut-off completions than this and the mode goes back to its default
+BUDGET_MAX_TRUNCATED = 0.02
+BUDGET_COLUMNS = ("mode", "status", "completion_tokens", "finish_reason")
+
+# Admin view grouping label -> inference_log column
+ROLLUP_DIMENSIONS = {"Mode": "mode", "User": "user_id", "Prompt version": "prompt_version", "Day": "day"}
+
+def since_iso(days):
+    return (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+
+def rollup(rows, by="mode"):
+    """DataFrame of per-group call stats, busiest group first (empty frame when no rows)"""
+    df = pd.DataFrame(rows, columns=INFERENCE_LOG_COLUMNS)
+    if df.empty:
+        return pd.DataFrame()
+    df["day"] = pd.to_datetime(df["created_at"], utc=True, format="ISO8601").dt.strftime("%Y-%m-%d")
+    key = df[by].fillna("—") if by else pd.Series("all", index=df.index)
+    numeric = ["prompt_tokens", "completion_tokens", "image_bytes", "attempts", "ttfb_ms", "latency_ms"]
+    df[numeric] = df[numeric].apply(pd.to_numeric, errors="coerce")
+    df["error"] = df["status"].eq("error")
+    df["truncated"] = df["finish_reason"].eq("length")
+
+    groups = df.groupby(key)
+    out = pd.DataFrame({
+        "calls": groups.size(),
+        "error_rate_%": groups["error"].mean() * 100,
+        "prompt_tokens": groups["prompt_tokens"].sum(),
+        "completion_tokens": groups["completion_tokens"].sum(),
+        "avg_prompt_tokens": groups["prompt_tokens"].mean(),
+        "avg_completion_tokens": groups["completion_tokens"].mean(),
+        "completion_p95_tokens": groups["completion_tokens"].quantile(0.95),
+        "truncated_%": groups["truncated"].mean() * 100,
+        "avg_image_kb": groups["image_bytes"].mean() / 1024,
+        "avg_attempts": groups["attempts"].mean(),
+        "ttfb_p50_ms": groups["ttfb_ms"].quantile(0.5),
+        "latency_p50_ms": groups["latency_ms"].quantile(0.5),
+        "latency_p95_ms": groups["latency_ms"].quantile(0.95),
+    })
+    return out.sort_values("calls", ascending=False).round(1)
+
+def completion_budgets(rows):
+    """
+    {mode: max_tokens} from inference_log rows: the BUDGET_PERCENTILE
+    completion length of successful calls times BUDGET_HEADROOM, never
+    below BUDGET_FLOOR. Modes with too few calls, or whose budget already
+    cuts off more than BUDGET_MAX_TRUNCATED of completions, are left out
+    (callers use their default).
+    """
+    df = pd.DataFrame(rows, columns=BUDGET_COLUMNS)
+    df = df[df["status"].eq("ok")].assign(completion_tokens=lambda d: pd.to_numeric(d["completion_tokens"], errors="coerce"))
+    budgets = {}
+    for mode, calls in df.dropna(subset=["mode", "completion_tokens"]).groupby("mode"):
+        if len(calls) < BUDGET_MIN_SAMPLES or calls["finish_reason"].eq("length").mean() > BUDGET_MAX_TRUNCATED:
+            continue
+        observed = calls["completion_tokens"].quantile(BUDGET_PERCENTILE)
+        budgets[mode] = max(BUDGET_FLOOR, math.ceil(observed * BUDGET_HEADROOM))
+    return budgets
+
+class CompletionBudgets:
+    """
+    Per-mode max_tokens learned from the inference log, shared by every
+    engine in the process and refreshed at most every `ttl` seconds.
+    A failed refresh keeps the previous budgets.
+    """
+
+    def __init__(self, days=BUDGET_WINDOW_DAYS, ttl=600):
+        self.days = days
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._budgets = {}
+        self._loaded_at = None
+
+    def max_tokens(self, repo, mode, default):
+        """Learned budget for mode, capped at default (the mode's fixed ceiling)"""
+        with self._lock:
+            if repo is not None and (self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl):
+                self._loaded_at = time.monotonic()
+                try:
+                    rows = repo.fetch_inference_log(since_iso(self.days), columns=BUDGET_COLUMNS)
+                    self._budgets = completion_budgets(rows)
+                except Exception:
+                    log.warning("could not refresh completion budgets", exc_info=True)
+            budget = self._budgets.get(mode, default)
+        return min(budget, default)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._budgets)
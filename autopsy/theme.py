@@ -0,0 +1,83 @@
+"""
+Theme delivery for the Streamlit app.
+
+static/theme.css is served by Streamlit's static file server
+(server.enableStaticServing in .streamlit/config.toml) and linked with a
+content-hash query string. Browsers fetch it once per theme version instead
+of receiving the full <style> block in every rerun's delta. Fonts still come
+from Google Fonts through the stylesheet's @import.
+
+    python -m autopsy.theme measure       # per-rerun delta bytes, inline vs linked
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+
+STATIC_DIR = Path(__file__).resolve().parent.parent / "static"
+THEME_CSS = STATIC_DIR / "theme.css"
+STATIC_URL = "app/static"          # where Streamlit mounts ./static
+
+@lru_cache(maxsize=1)
+def theme_version():
+    """Short content hash; changes whenever theme.css does"""
+    return hashlib.sha256(THEME_CSS.read_bytes()).hexdigest()[:12]
+
+@lru_cache(maxsize=2)
+def theme_markup(static_serving=True):
+    """<link> to the versioned stylesheet, or the inline <style> block as a fallback"""
+    if static_serving:
+        return f'<link rel="stylesheet" href="{STATIC_URL}/theme.css?v={theme_version()}">'
+    return f"<style>\n{THEME_CSS.read_text(encoding='utf-8')}\n</style>"
+
+def measure_rerun_bytes(app_path, static_serving, secrets=None, user=None):
+    """Total serialized ForwardMsg bytes produced by one run of the app script"""
+    from streamlit import config
+    from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+    from streamlit.testing.v1 import AppTest
+
+    sizes = []
+    enqueue = ForwardMsgQueue.enqueue
+
+    def counting_enqueue(self, msg):
+        sizes.append(msg.ByteSize())
+        return enqueue(self, msg)
+
+    config.set_option("server.enableStaticServing", static_serving)
+    at = AppTest.from_file(str(Path(app_path).resolve()), default_timeout=60)
+    for key, value in (secrets or {}).items():
+        at.secrets[key] = value
+    if user:
+        at.session_state["authenticated"] = True
+        at.session_state["user"] = user
+    at.run()                                    # warm-up: caches, first-run setup
+
+    ForwardMsgQueue.enqueue = counting_enqueue
+    try:
+        at.run()
+    finally:
+        ForwardMsgQueue.enqueue = enqueue
+    return sum(sizes)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m autopsy.theme", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    measure = sub.add_parser("measure", help="per-rerun delta bytes with the theme inline vs linked")
+    measure.add_argument("--app", default="app.py")
+    measure.add_argument("--user", help="measure an authenticated rerun as this user")
+    measure.add_argument("--db", help="LOCAL_DB_PATH for the run (default: a throwaway sqlite file)")
+    args = parser.parse_args(argv)
+
+    db = args.db or os.path.join(tempfile.mkdtemp(), "measure.db")
+    secrets = {"STORAGE_BACKEND": "sqlite", "LOCAL_DB_PATH": db, "HF_TOKEN": "measure"}
+    inline = measure_rerun_bytes(args.app, False, secrets, args.user)
+    linked = measure_rerun_bytes(args.app, True, secrets, args.user)
+    print(f"theme.css       {THEME_CSS.stat().st_size:>9,} bytes (fetched once per version)")
+    print(f"rerun, inline   {inline:>9,} bytes")
+    print(f"rerun, linked   {linked:>9,} bytes  ({inline - linked:,} saved per rerun)")
+
+if __name__ == "__main__":
+    main()
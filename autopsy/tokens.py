@@ -0,0 +1,84 @@
+"""
+Local prompt token counting and the per-mode prompt budget.
+
+Uses the served model's own tokenizer (the optional `tokenizers` package,
+tokenizer.json fetched once from the Hugging Face hub) so counts match the
+router's prompt_tokens. Without it - package missing, hub unreachable - it
+falls back to a word / symbol estimate; tokenizer_name() says which one
+produced a count.
+
+Every template's system prefix is checked against prompts.PROMPT_BUDGETS:
+
+    python -m autopsy.tokens budget      # exits 1 when a prefix is over
+"""
+import argparse
+import logging
+import re
+import sys
+from functools import lru_cache
+
+from .inference import MODEL_ID
+from .prompts import PROMPT_BUDGETS, PROMPTS
+
+log = logging.getLogger(__name__)
+
+# Words, short digit runs and single symbols (box-drawing / emoji
+# characters are at least one token each in BPE vocabularies)
+_ESTIMATE_PATTERN = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+
+@lru_cache(maxsize=1)
+def _tokenizer():
+    try:
+        from tokenizers import Tokenizer
+        return Tokenizer.from_pretrained(MODEL_ID)
+    except Exception as e:
+        log.info("model tokenizer unavailable (%s); estimating prompt tokens", e)
+        return None
+
+def tokenizer_name():
+    return "model" if _tokenizer() is not None else "estimate"
+
+@lru_cache(maxsize=64)
+def count_tokens(text):
+    """Token count of one message's text (cached: system prefixes repeat)"""
+    tokenizer = _tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    return len(_ESTIMATE_PATTERN.findall(text))
+
+def prompt_tokens(prompt):
+    """Text tokens of a rendered prompts.Prompt (images are not counted)"""
+    return count_tokens(prompt.system) + count_tokens(prompt.user)
+
+def budget_for(template_name):
+    """Mode budget of a template or variant name ("trade_audit.compact" -> trade_audit's)"""
+    return PROMPT_BUDGETS.get(template_name.partition(".")[0])
+
+def check_budget(prompt):
+    """Log a warning when the prompt's system prefix is over its mode budget; returns the prefix tokens"""
+    tokens = count_tokens(prompt.system)
+    budget = budget_for(prompt.name)
+    if budget and tokens > budget:
+        log.warning("%s system prompt is %d tokens, over its %d budget", prompt.version, tokens, budget)
+    return tokens
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m autopsy.tokens", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("budget", help="system prefix tokens per template against its mode budget")
+    parser.parse_args(argv)
+
+    over = False
+    print(f"{'template':<32}{'text':>8}{'image':>8}{'budget':>8}   ({tokenizer_name()} counts)")
+    for name, template in PROMPTS.items():
+        text = count_tokens(template.system_for(image=False))
+        image = count_tokens(template.system_for(image=True))
+        budget = budget_for(name)
+        flag = "  OVER" if budget and max(text, image) > budget else ""
+        over = over or bool(flag)
+        print(f"{template.tag:<32}{text:>8,}{image:>8,}{budget or '-':>8}{flag}")
+    sys.exit(1 if over else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""
+gunicorn settings for the REST API (autopsy/api.py):
+
+    gunicorn "autopsy.api:create_app()"
+
+Requests only queue or read jobs, so they return in milliseconds; the
+model calls run on each worker's job threads (API_JOB_THREADS).
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = 30
+keepalive = 5
+# Give in-flight audits time to finish on reload / shutdown
+graceful_timeout = 120
+# Each worker builds its own app (DB client, HTTP pool, job threads) after fork
+preload_app = False
+accesslog = "-"
@@ -0,0 +1,27 @@
+-- ==========================================
+-- 001: Store full structured results + raw model output
+-- ==========================================
+-- Every audit now keeps the sub-scores parse_report extracts and the raw
+-- completion it parsed them from, so the dashboard can chart sub-scores
+-- without re-inference and parser fixes can be backfilled offline.
+
+alter table trades
+    add column if not exists overall_grade      text,
+    add column if not exists entry_quality      smallint,
+    add column if not exists exit_quality       smallint,
+    add column if not exists risk_score         smallint,
+    add column if not exists strength           text,
+    add column if not exists critical_error     text,
+    add column if not exists trade_state        text default 'UNKNOWN',
+    add column if not exists analysis_mode      text,
+    add column if not exists raw_response       text,
+    add column if not exists model_id           text,
+    add column if not exists prompt_version     text,
+    add column if not exists prompt_tokens      integer,
+    add column if not exists completion_tokens  integer,
+    add column if not exists latency_ms         integer;
+
+-- Backfill job scans rows that still have a raw completion to re-parse
+create index if not exists trades_raw_response_idx
+    on trades (id)
+    where raw_response is not null;
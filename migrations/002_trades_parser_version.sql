@@ -0,0 +1,8 @@
+-- ==========================================
+-- 002: Track which parser produced the structured fields
+-- ==========================================
+-- Written on insert and by `python -m autopsy.backfill` whenever a
+-- re-parse changes a row.
+
+alter table trades
+    add column if not exists parser_version text;
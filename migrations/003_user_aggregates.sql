@@ -0,0 +1,17 @@
+-- ==========================================
+-- 003: Per-user dashboard aggregates
+-- ==========================================
+-- One row per user, updated on every audit insert (see UserAggregates in
+-- autopsy/aggregates.py). The Performance Metrics KPI row renders from
+-- this row instead of scanning the full trades history.
+
+create table if not exists user_aggregates (
+    user_id        text primary key,
+    total_audits   integer not null default 0,
+    score_sum      bigint  not null default 0,
+    quality_count  integer not null default 0,       -- audits with score > 60
+    tag_counts     jsonb   not null default '{}',     -- {tag: count}
+    band_counts    jsonb   not null default '[0,0,0,0]',  -- Poor / Fair / Good / Excellent
+    recent_scores  jsonb   not null default '[]',     -- newest first, last 10
+    updated_at     timestamptz
+);
@@ -0,0 +1,16 @@
+-- ==========================================
+-- 004: Canonical mistake-tag codes
+-- ==========================================
+-- Raw model tags stay in mistake_tags; mistake_tag_codes holds their
+-- canonical taxonomy codes (index into TAXONOMY in autopsy/tags.py).
+-- Populate existing rows with `python -m autopsy.backfill`.
+
+alter table trades
+    add column if not exists mistake_tag_codes smallint[] default '{}';
+
+create index if not exists trades_mistake_tag_codes_idx
+    on trades using gin (mistake_tag_codes);
+
+-- user_aggregates.tag_counts switches from raw tag text to taxonomy codes.
+-- Rows are rebuilt lazily from history on the next dashboard view.
+truncate table user_aggregates;
@@ -0,0 +1,13 @@
+-- ==========================================
+-- 005: Behavioral state in user_aggregates
+-- ==========================================
+-- Serialized BehaviorState (autopsy/behavior.py): rolling score windows,
+-- low-score streaks, time between audits, emotion-state transitions and
+-- FOMO -> Revenge sequence timestamps. Folded forward on every insert.
+
+alter table user_aggregates
+    add column if not exists behavior jsonb not null default '{}';
+
+-- Existing rows have no timeline state yet; they are rebuilt lazily from
+-- history on the next dashboard view.
+truncate table user_aggregates;
@@ -0,0 +1,28 @@
+-- ==========================================
+-- 006: Per-call inference log
+-- ==========================================
+-- One row per model call (AuditEngine.handle_job): token usage, uploaded
+-- image size, attempts and total latency, tagged by user, analysis mode
+-- and prompt version. ttfb_ms: dropped in 009 (it was total latency),
+-- re-added in 011 as the streamed time to first token. Failed calls are logged too,
+-- with status 'error'. Rolled up in the admin view (autopsy/telemetry.py).
+
+create table if not exists inference_log (
+    id                 bigint generated always as identity primary key,
+    created_at         timestamptz not null default now(),
+    user_id            text,
+    job_id             text,
+    mode               text,
+    prompt_version     text,
+    model_id           text,
+    status             text not null,          -- 'ok' | 'error'
+    error              text,
+    prompt_tokens      integer,
+    completion_tokens  integer,
+    image_bytes        integer,
+    attempts           smallint,
+    ttfb_ms            integer,
+    latency_ms         integer
+);
+
+create index if not exists inference_log_created_idx on inference_log (created_at);
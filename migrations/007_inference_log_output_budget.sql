@@ -0,0 +1,11 @@
+-- ==========================================
+-- 007: Output budget in the inference log
+-- ==========================================
+-- max_tokens sent with each call (derived per mode from recent completion
+-- lengths, see autopsy/telemetry.py) and the router's finish_reason:
+-- 'stop' when the [END] stop sequence or end of turn was reached,
+-- 'length' when the completion was cut off at max_tokens.
+
+alter table inference_log
+    add column if not exists max_tokens integer,
+    add column if not exists finish_reason text;
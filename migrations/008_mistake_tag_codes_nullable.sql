@@ -0,0 +1,17 @@
+-- ==========================================
+-- 008: mistake_tag_codes without a default
+-- ==========================================
+-- 004 originally gave the column an empty-array default, so rows that
+-- pre-date the taxonomy read as "no codes" instead of NULL and their tags
+-- vanished from rebuilt aggregates. Drop the default, mark those rows as
+-- not yet encoded, and let the aggregates rebuild (lazily, on the next
+-- dashboard view). `python -m autopsy.backfill` encodes them eagerly.
+
+alter table trades
+    alter column mistake_tag_codes drop default;
+
+update trades
+    set mistake_tag_codes = null
+    where mistake_tag_codes = '{}';
+
+truncate table user_aggregates;
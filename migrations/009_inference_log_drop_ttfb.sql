@@ -0,0 +1,9 @@
+-- ==========================================
+-- 009: Drop inference_log.ttfb_ms
+-- ==========================================
+-- Completions are not streamed, so the router sends its response headers
+-- only once generation is done: the value recorded as time to first byte
+-- was total latency under another name. latency_ms keeps the real figure.
+
+alter table inference_log
+    drop column if exists ttfb_ms;
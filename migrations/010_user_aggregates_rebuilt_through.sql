@@ -0,0 +1,10 @@
+-- ==========================================
+-- 010: Rebuild high-water mark in user_aggregates
+-- ==========================================
+-- Highest trades.id folded in when the row was rebuilt from history
+-- (AuditEngine.rebuild_aggregates). A save whose trade id is at or below
+-- it was already counted by the rebuild and is not added again, so a
+-- rebuild racing concurrent saves cannot double-count an audit.
+
+alter table user_aggregates
+    add column if not exists rebuilt_through bigint;
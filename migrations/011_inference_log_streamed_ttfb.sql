@@ -0,0 +1,9 @@
+-- ==========================================
+-- 011: Re-add inference_log.ttfb_ms, measured on the stream
+-- ==========================================
+-- Completions are now streamed (InferenceClient._post), so the time to the
+-- first chunk is the real time to first token rather than total latency
+-- (see 009). Null for calls that failed before any chunk arrived.
+
+alter table inference_log
+    add column if not exists ttfb_ms integer;
@@ -0,0 +1,7 @@
+import pytest
+
+from autopsy.storage import SQLiteRepository
+
+@pytest.fixture
+def repo(tmp_path):
+    return SQLiteRepository(str(tmp_path / "trades.db"))
@@ -0,0 +1,128 @@
+import pandas as pd
+import pytest
+
+from autopsy.aggregates import UserAggregates
+from autopsy.analytics import summarize
+from autopsy.behavior import BehaviorState
+from autopsy.engine import AuditEngine
+from autopsy.storage import SQLiteRepository
+
+SCORES = [35, 72, 55, 90, 61, 40, 85, 20, 66, 78, 59, 81]
+CODES = [[1], [], [1, 6], [2], [], [6], [], [1, 2], [3], [], [6], [1]]
+
+def _history(repo, user_id="u"):
+    for i, (score, codes) in enumerate(zip(SCORES, CODES)):
+        repo.insert_trade({"user_id": user_id, "score": score, "mistake_tag_codes": codes,
+                           "created_at": f"2026-01-{i + 1:02d}T10:00:00"})
+
+def _kpis(agg):
+    return (agg.total_audits, agg.score_sum, agg.quality_count, dict(agg.tag_counts),
+            agg.band_counts, agg.recent_scores)
+
+def test_incremental_matches_rebuild():
+    incremental = UserAggregates.from_history("u", SCORES, CODES)
+    # summarize() takes the dashboard's newest-first frame
+    frame = pd.DataFrame({"score": SCORES[::-1], "mistake_tag_codes": CODES[::-1],
+                          "created_at": pd.date_range("2026-01-01", periods=len(SCORES))[::-1]})
+    rebuilt = summarize(frame).to_aggregates("u", behavior=BehaviorState())
+    assert _kpis(incremental) == _kpis(rebuilt)
+
+def test_row_round_trip(repo):
+    agg = UserAggregates.from_history("u", SCORES, CODES)
+    assert repo.insert_aggregates(agg.to_row())
+    assert not repo.insert_aggregates(agg.to_row())          # insert-if-absent
+    loaded = UserAggregates.from_row(repo.fetch_aggregates("u"))
+    assert _kpis(loaded) == _kpis(agg)
+    assert loaded.behavior.to_dict() == agg.behavior.to_dict()
+
+def test_replace_is_compare_and_set(repo):
+    agg = UserAggregates.from_history("u", SCORES, CODES)
+    repo.insert_aggregates(agg.to_row())
+    stale = agg.updated_at
+    assert repo.replace_aggregates(agg.add(50, []).to_row(), stale)
+    assert not repo.replace_aggregates(agg.add(50, []).to_row(), stale)
+    assert repo.fetch_aggregates("u")["total_audits"] == len(SCORES) + 1
+
+def test_save_path_keeps_row_in_step(repo):
+    engine = AuditEngine(client=None, repo=repo)
+    _history(repo)
+    engine.load_aggregates("u")
+    repo.insert_trade({"user_id": "u", "score": 95, "mistake_tag_codes": [2]})
+    agg = engine.update_aggregates("u", 95, [2])
+    assert agg.total_audits == len(SCORES) + 1
+    assert repo.fetch_aggregates("u")["total_audits"] == len(SCORES) + 1
+
+class RacingRepository(SQLiteRepository):
+    """Runs `before[name]` once, right before that repository call - a concurrent save cutting in"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.before = {}
+
+    def _cut_in(self, name):
+        hook = self.before.pop(name, None)
+        if hook:
+            hook()
+
+    def insert_aggregates(self, row):
+        self._cut_in("insert_aggregates")
+        return super().insert_aggregates(row)
+
+    def replace_aggregates(self, row, expected_updated_at):
+        self._cut_in("replace_aggregates")
+        return super().replace_aggregates(row, expected_updated_at)
+
+@pytest.fixture
+def racing(tmp_path):
+    return RacingRepository(str(tmp_path / "trades.db"))
+
+def _save(engine, score=70, codes=(1,)):
+    """engine.save's two steps: insert the trade, then fold it in"""
+    trade_id = engine.repo.insert_trade({"user_id": "u", "score": score, "mistake_tag_codes": list(codes)})
+    return trade_id, lambda: engine.update_aggregates("u", score, list(codes), trade_id)
+
+def test_rebuild_after_insert_is_not_counted_twice(repo):
+    engine = AuditEngine(client=None, repo=repo)
+    _history(repo)
+    _, fold = _save(engine)
+    engine.load_aggregates("u")             # dashboard read rebuilds, already seeing the new trade
+    fold()
+    assert repo.fetch_aggregates("u")["total_audits"] == len(SCORES) + 1
+
+def test_lost_rebuild_race_keeps_the_audit(racing):
+    engine = AuditEngine(client=None, repo=racing)
+    _history(racing)
+    stale = engine.rebuild_aggregates("u")  # a rebuild that read history before our trade
+    _, fold = _save(engine)
+    racing.before["insert_aggregates"] = lambda: SQLiteRepository.insert_aggregates(racing, stale.to_row())
+    fold()
+    assert racing.fetch_aggregates("u")["total_audits"] == len(SCORES) + 1
+
+def test_cas_conflict_retries(racing):
+    engine = AuditEngine(client=None, repo=racing)
+    _history(racing)
+    engine.load_aggregates("u")
+    _, fold_ours = _save(engine, score=90)
+    _, fold_theirs = _save(engine, score=10)
+    racing.before["replace_aggregates"] = fold_theirs
+    fold_ours()
+    row = racing.fetch_aggregates("u")
+    assert row["total_audits"] == len(SCORES) + 2
+    assert row["score_sum"] == sum(SCORES) + 100
+
+def test_save_counts_each_audit_once(repo):
+    engine = AuditEngine(client=None, repo=repo)
+    for score in (40, 80):
+        _, fold = _save(engine, score=score)
+        fold()
+    assert engine.load_aggregates("u").total_audits == 2
+    repo.delete_aggregates(["u"])
+    assert engine.load_aggregates("u").rebuilt_through == 2
+
+def test_delete_forces_rebuild(repo):
+    engine = AuditEngine(client=None, repo=repo)
+    _history(repo)
+    engine.load_aggregates("u")
+    repo.delete_aggregates(["u"])
+    assert repo.fetch_aggregates("u") is None
+    assert engine.load_aggregates("u").total_audits == len(SCORES)
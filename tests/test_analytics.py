@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from autopsy.aggregates import UserAggregates
+from autopsy.analytics import summarize
+from autopsy.tags import TAXONOMY
+
+def _frame(n, seed=7):
+    """A newest-first history frame as fetch_score_series returns it"""
+    rng = np.random.default_rng(seed)
+    created = pd.date_range("2025-01-01", periods=n, freq="h")[::-1]
+    codes = [sorted(set(rng.integers(0, len(TAXONOMY), rng.integers(0, 4)).tolist())) for _ in range(n)]
+    return pd.DataFrame({"created_at": created, "score": rng.integers(0, 101, n), "mistake_tag_codes": codes})
+
+def test_chart_data_matches_sorted_frame():
+    frame = _frame(500)
+    summary = summarize(frame)
+    # The pandas path summarize() replaced: sort by time, then number the points
+    expected = frame[["created_at", "score"]].sort_values("created_at").reset_index(drop=True)
+    expected["index"] = range(len(expected))
+    pd.testing.assert_frame_equal(summary.chart_data, expected, check_dtype=False)
+
+def test_counts_match_incremental_aggregates():
+    frame = _frame(500)
+    summary = summarize(frame)
+    agg = UserAggregates.from_history("u", frame["score"].tolist()[::-1], frame["mistake_tag_codes"].tolist()[::-1])
+    rebuilt = summary.to_aggregates("u")
+    assert rebuilt.total_audits == agg.total_audits
+    assert rebuilt.score_sum == agg.score_sum
+    assert rebuilt.quality_count == agg.quality_count
+    assert rebuilt.tag_counts == agg.tag_counts
+    assert rebuilt.band_counts == agg.band_counts
+    assert rebuilt.recent_scores == agg.recent_scores
+    assert rebuilt.top_tags(6) == agg.top_tags(6)
+    assert rebuilt.band_distribution() == agg.band_distribution()
+
+def test_empty_history():
+    summary = summarize(pd.DataFrame({"created_at": [], "score": [], "mistake_tag_codes": []}))
+    assert summary.total_audits == 0
+    assert summary.chart_data.empty
+    assert summary.to_aggregates("u").band_counts == [0, 0, 0, 0]
@@ -0,0 +1,117 @@
+import json
+import time
+
+import pytest
+
+from autopsy import api
+
+REPORT = """[SCORE] 72
+[OVERALL_GRADE] B
+[ENTRY_QUALITY] 70
+[EXIT_QUALITY] 65
+[RISK_SCORE] 60
+[TAGS] FOMO, Late_Entry
+[TECH] Entry came after the breakout had already run two full candles.
+[PSYCH] Chased the move after watching it lift off without a position.
+[RISK] Stop was sized sensibly at roughly one ATR below the entry.
+[FIX] Wait for the first pullback to the breakout level before entering.
+[STRENGTH] Respected the stop and kept the loss small and controlled.
+[CRITICAL_ERROR] Entered late on fear of missing the move entirely.
+[END]"""
+
+TRADE = {"ticker": "SPY", "entry": 445, "exit": 451, "stop": 440}
+
+class RouterResponse:
+    """REPORT streamed as server-sent events, usage on the last chunk"""
+    status_code = 200
+    text = ""
+    headers = {"content-type": "text/event-stream"}
+
+    def iter_lines(self, decode_unicode=False):
+        for line in REPORT.splitlines(keepends=True):
+            yield "data: " + json.dumps({"model": "test-model", "choices": [{"delta": {"content": line}}]})
+        yield "data: " + json.dumps({"model": "test-model", "choices": [{"delta": {}, "finish_reason": "stop"}],
+                                     "usage": {"prompt_tokens": 900, "completion_tokens": 180}})
+        yield "data: [DONE]"
+
+class RouterSession:
+    """Stands in for the HTTP pool: every chat completion returns REPORT"""
+
+    def post(self, url, **kwargs):
+        return RouterResponse()
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # Captured by the app's engine, so queue threads outliving the test stay offline
+    monkeypatch.setattr(api, "create_http_session", RouterSession)
+    app = api.create_app({
+        "STORAGE_BACKEND": "sqlite",
+        "LOCAL_DB_PATH": str(tmp_path / "trades.db"),
+        "JOBS_DB_PATH": str(tmp_path / "jobs.db"),
+        "API_KEYS": "k1:alice,k2:bob",
+        "API_JOB_THREADS": "1",
+    })
+    return app.test_client()
+
+def _auth(key="k1"):
+    return {"Authorization": f"Bearer {key}"}
+
+def _poll(client, job_id, key="k1", timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/v1/jobs/{job_id}", headers=_auth(key)).get_json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+def test_auth(client):
+    assert client.get("/healthz").status_code == 200
+    assert client.get("/v1/usage").status_code == 401
+    assert client.get("/v1/usage", headers={"Authorization": "Bearer nope"}).status_code == 401
+    assert client.get("/v1/usage", headers={"Authorization": "Basic k1"}).status_code == 401
+    res = client.get("/v1/usage", headers=_auth())
+    assert res.status_code == 200
+    assert res.get_json()["user_id"] == "alice"
+
+@pytest.mark.parametrize("path, body, message", [
+    ("/v1/audits/text", {"entry": 1}, "'ticker' is required"),
+    ("/v1/audits/text", {"ticker": "SPY", "entry": "abc"}, "'entry' must be a number"),
+    ("/v1/audits/text", {"ticker": 42}, "'ticker' must be a string"),
+    ("/v1/audits/chart", {"image_b64": "###"}, "'image_b64' is not valid base64"),
+    ("/v1/audits/chart", {}, "an 'image' upload or 'image_b64' field is required"),
+    ("/v1/audits/portfolio", {"total_invested": 0, "current_value": 10}, "'total_invested' must be positive"),
+    ("/v1/audits/portfolio", {"total_invested": 10, "current_value": -1}, "'current_value' cannot be negative"),
+    ("/v1/audits/batch", {"trades": []}, "'trades' must be a non-empty JSON list"),
+    ("/v1/audits/batch", {"trades": ["SPY"]}, "each trade must be a JSON object"),
+    ("/v1/audits/batch", {"trades": [{"ticker": ["SPY"]}]}, "'ticker' must be a string"),
+])
+def test_validation(client, path, body, message):
+    res = client.post(path, json=body, headers=_auth())
+    assert res.status_code == 400
+    assert res.get_json()["error"] == message
+
+def test_wiped_out_portfolio_is_accepted(client):
+    res = client.post("/v1/audits/portfolio", json={"total_invested": 1000, "current_value": 0}, headers=_auth())
+    assert res.status_code == 202
+
+def test_submit_then_poll(client):
+    res = client.post("/v1/audits/text", json=TRADE, headers=_auth())
+    assert res.status_code == 202
+    body = res.get_json()
+    assert body["poll"] == f"/v1/jobs/{body['job_id']}"
+
+    job = _poll(client, body["job_id"])
+    assert job["status"] == "done", job.get("error")
+    assert "params" not in job
+    assert job["result"]["report"]["score"] == 72
+
+    # The worker saved it to the caller's history and aggregates
+    audits = client.get("/v1/history", headers=_auth()).get_json()["audits"]
+    assert [a["ticker"] for a in audits] == ["SPY"]
+    assert client.get("/v1/aggregates", headers=_auth()).get_json()["total_audits"] == 1
+
+def test_jobs_are_private(client):
+    job_id = client.post("/v1/audits/text", json=TRADE, headers=_auth()).get_json()["job_id"]
+    assert client.get(f"/v1/jobs/{job_id}", headers=_auth("k2")).status_code == 404
+    assert client.get("/v1/history", headers=_auth("k2")).get_json()["audits"] == []
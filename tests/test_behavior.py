@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+
+from autopsy import behavior
+from autopsy.behavior import CALM, LOW_SCORE, REENTRY_MINUTES, ROLLING_WINDOWS, BehaviorState
+from autopsy.tags import FOMO, REVENGE, TILT
+
+T0 = datetime(2026, 3, 2, 9, 30, tzinfo=timezone.utc)
+
+def _replay(audits, start=T0):
+    """BehaviorState from (minutes after start, score, codes) tuples"""
+    state = BehaviorState()
+    for minutes, score, codes in audits:
+        state.add(score, codes, start + timedelta(minutes=minutes))
+    return state
+
+def test_empty_history():
+    frame = pd.DataFrame({"created_at": [], "score": [], "mistake_tag_codes": []})
+    for state in (BehaviorState(), BehaviorState.from_history(frame), BehaviorState.from_dict(None)):
+        assert state.rolling_mean() is None
+        assert state.low_streak == state.longest_low_streak == state.quick_reentries == 0
+        assert state.last_gap_s is None
+        assert state.fomo_revenge_count(now=T0) == 0
+        assert state.emotional_transitions() == []
+        assert state.to_dict() == BehaviorState().to_dict()
+
+def test_streaks():
+    state = _replay([(i * 600, score, []) for i, score in enumerate([20, 35, LOW_SCORE, 80, 10, 30, 90])])
+    assert state.low_streak == 0
+    assert state.longest_low_streak == 3                # LOW_SCORE itself counts as low
+    state.add(15, [], T0 + timedelta(days=30))
+    assert state.low_streak == 1
+
+def test_rolling_means():
+    state = _replay([(i * 600, score, []) for i, score in enumerate([50, 60, 70])])
+    assert state.rolling_mean() == 60
+    assert state.rolling_mean(ROLLING_WINDOWS[1]) is None
+    with pytest.raises(ValueError):
+        state.rolling_mean(max(ROLLING_WINDOWS) + 1)
+
+def test_fomo_revenge_transitions():
+    state = _replay([
+        (0, 55, [FOMO]),
+        (60, 30, [REVENGE]),            # FOMO -> Revenge
+        (120, 25, [REVENGE]),           # Revenge -> Revenge: not a new sequence
+        (180, 70, [FOMO]),
+        (240, 60, []),
+        (300, 35, [REVENGE]),           # Calm in between
+        (360, 45, [FOMO, TILT]),
+        (420, 20, [REVENGE, TILT]),     # FOMO among the tags is enough
+    ])
+    assert len(state.fomo_revenge_at) == 2
+    # Emotion state is the lowest-coded emotion tag, so the last pair is FOMO -> Revenge too
+    assert state.transitions["FOMO>Revenge_Trading"] == 2
+    assert state.transitions[f"FOMO>{CALM}"] == 1
+    assert state.emotional_transitions()[0] == ("FOMO", "Revenge_Trading", 2)
+
+def test_quick_reentry_after_low_score():
+    state = _replay([
+        (0, 30, []),
+        (10, 75, []),                   # 10 min after a low score
+        (20, 35, []),                   # after a good score: not counted
+        (20 + 3 * 60, 60, []),          # hours later: not counted
+    ])
+    assert state.quick_reentries == 1
+    assert state.last_gap_s == 3 * 3600
+    assert state.gap_count == 3
+    assert state.gap_mean_s == pytest.approx((600 + 600 + 3 * 3600) / 3)
+
+def test_reentry_window_boundary():
+    at_edge = _replay([(0, 30, []), (REENTRY_MINUTES, 60, [])])
+    past_edge = _replay([(0, 30, []), (REENTRY_MINUTES + 1 / 60, 60, [])])
+    assert at_edge.quick_reentries == 1
+    assert past_edge.quick_reentries == 0
+
+def test_reentry_window_is_configurable(monkeypatch):
+    audits = [(0, 30, []), (45, 60, [])]
+    assert _replay(audits).quick_reentries == 0
+    monkeypatch.setattr(behavior, "REENTRY_MINUTES", 60)
+    assert _replay(audits).quick_reentries == 1
+
+def test_sequence_count_windows():
+    days = [0, 20, 25, 29]
+    state = BehaviorState()
+    for day in days:
+        state.add(55, [FOMO], T0 + timedelta(days=day))
+        state.add(30, [REVENGE], T0 + timedelta(days=day, hours=1))
+    now = T0 + timedelta(days=30, hours=1)
+    assert state.fomo_revenge_count(days=30, now=now) == 4          # the first one sits on the cutoff
+    assert state.fomo_revenge_count(days=7, now=now) == 2
+    # Window edges are inclusive: day 29's sequence is exactly one day old
+    assert state.fomo_revenge_count(days=1, now=now) == 1
+    assert state.fomo_revenge_count(days=1, now=now + timedelta(microseconds=1)) == 0
+
+def test_sequences_expire_after_retention():
+    state = _replay([(0, 55, [FOMO]), (60, 30, [REVENGE])])
+    later = T0 + timedelta(days=behavior.SEQUENCE_RETENTION_DAYS, hours=2)
+    state.add(80, [], later)
+    assert state.fomo_revenge_at == []
+
+def test_round_trip():
+    state = _replay([(0, 55, [FOMO]), (10, 30, [REVENGE]), (25, 20, [TILT])])
+    restored = BehaviorState.from_dict(state.to_dict())
+    assert restored.to_dict() == state.to_dict()
+    assert restored.add(90, [], T0 + timedelta(hours=1)).low_streak == 0
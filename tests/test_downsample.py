@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from autopsy.downsample import MAX_CHART_POINTS, evolution_series, filter_range, lttb
+
+def _chart(n, freq="h"):
+    rng = np.random.default_rng(3)
+    frame = pd.DataFrame({"created_at": pd.date_range("2020-01-01", periods=n, freq=freq),
+                          "score": rng.integers(0, 101, n)})
+    frame["index"] = np.arange(n)
+    return frame
+
+def test_lttb_keeps_ends_and_extremes():
+    y = np.zeros(1000)
+    y[337], y[661] = 100, -100
+    keep = lttb(y, 50)
+    assert len(keep) == 50
+    assert keep[0] == 0 and keep[-1] == 999
+    assert np.all(np.diff(keep) > 0)
+    assert {337, 661} <= set(keep.tolist())
+
+def test_lttb_short_series_untouched():
+    assert lttb([1, 2, 3], 10).tolist() == [0, 1, 2]
+    assert lttb(np.arange(10), 2).tolist() == list(range(10))
+
+def test_raw_when_it_fits():
+    chart = _chart(MAX_CHART_POINTS)
+    frame, resolution = evolution_series(chart)
+    assert resolution == "raw" and frame is chart
+
+def test_finest_bucket_that_fits():
+    frame, resolution = evolution_series(_chart(24 * 200))          # 200 days of hourly audits
+    assert resolution == "daily"
+    assert len(frame) == 200
+    assert frame["count"].sum() == 24 * 200
+    assert (frame["score_min"] <= frame["score"]).all() and (frame["score"] <= frame["score_max"]).all()
+
+def test_lttb_without_timestamps():
+    chart = _chart(5000)
+    chart.loc[10, "created_at"] = pd.NaT
+    frame, resolution = evolution_series(chart)
+    assert resolution == "lttb"
+    assert len(frame) == MAX_CHART_POINTS
+
+def test_filter_range():
+    chart = _chart(100, freq="D")
+    assert len(filter_range(chart, 30)) == 31
+    assert filter_range(chart, 30)["index"].iloc[0] == 69          # global trade index kept
+    assert filter_range(chart, None) is chart
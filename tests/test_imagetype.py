@@ -0,0 +1,48 @@
+import base64
+import io
+
+from PIL import Image, ImageDraw
+
+from autopsy.imagetype import PORTFOLIO_IMAGE, TRADE_IMAGE, classify_image, layout_features
+
+def _b64(image):
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue()).decode()
+
+def _holdings_table(rows=14):
+    """Dark list of holdings: one text line per row, P/L in a single column"""
+    image = Image.new("RGB", (640, 640), (12, 12, 18))
+    draw = ImageDraw.Draw(image)
+    for i in range(rows):
+        y = 20 + i * 44
+        for x in range(20, 420, 9):
+            draw.rectangle([x, y, x + 5, y + 12], fill=(230, 230, 230))
+        draw.rectangle([520, y, 600, y + 12], fill=(20, 200, 60) if i % 2 else (220, 30, 30))
+    return image
+
+def _candle_chart(candles=60):
+    """Green / red candles spread across the plot area"""
+    image = Image.new("RGB", (640, 400), (12, 12, 18))
+    draw = ImageDraw.Draw(image)
+    price = 200
+    for i in range(candles):
+        x = 10 + i * 10
+        move = 15 if i % 3 else -20
+        colour = (20, 200, 60) if move > 0 else (220, 30, 30)
+        top, bottom = sorted((price, price - move))
+        draw.line([x + 3, top - 8, x + 3, bottom + 8], fill=colour)
+        draw.rectangle([x, top, x + 6, bottom], fill=colour)
+        price = max(60, min(340, price - move))
+    return image
+
+def test_portfolio_table():
+    features = layout_features(_b64(_holdings_table()))
+    assert features["text_bands"] >= 8
+    assert classify_image(_b64(_holdings_table())) == PORTFOLIO_IMAGE
+
+def test_trade_chart():
+    assert classify_image(_b64(_candle_chart())) == TRADE_IMAGE
+
+def test_ambiguous_image_keeps_combined_prompt():
+    assert classify_image(_b64(Image.new("RGB", (400, 300), (255, 255, 255)))) is None
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from autopsy.inference import InferenceClient, InferenceError
+
+SECTIONS = "[SCORE] 70\n[TECH] Clean breakout.\n[PSYCH] Calm.\n[RISK] Stop at ATR.\n"
+
+class Streamed:
+    """A 200 from the router: content streamed in two chunks, usage on the last"""
+    status_code = 200
+    text = ""
+    headers = {"content-type": "text/event-stream"}
+
+    def __init__(self, content, prompt_tokens=800, completion_tokens=150):
+        self.content = content
+        self.usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+
+    def iter_lines(self, decode_unicode=False):
+        half = len(self.content) // 2
+        for part in (self.content[:half], self.content[half:]):
+            yield "data: " + json.dumps({"model": "m", "choices": [{"delta": {"content": part}}]})
+            yield ""
+        yield "data: " + json.dumps({"choices": [{"delta": {}, "finish_reason": "stop"}], "usage": self.usage})
+        yield "data: [DONE]"
+
+class Failed:
+    status_code = 500
+    text = "boom"
+    headers = {"content-type": "application/json"}
+
+    def json(self):
+        return {"error": "boom"}
+
+class Session:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.posts = []
+
+    def post(self, url, **kwargs):
+        self.posts.append(kwargs)
+        return self.responses.pop(0)
+
+def test_complete_reads_the_stream():
+    session = Session(Streamed(SECTIONS))
+    content, meta = InferenceClient("t", session=session).complete("prompt")
+    assert content == SECTIONS
+    assert session.posts[0]["stream"] and session.posts[0]["json"]["stream"]
+    assert meta["model_id"] == "m"
+    assert (meta["prompt_tokens"], meta["completion_tokens"], meta["finish_reason"]) == (800, 150, "stop")
+    assert 0 <= meta["ttfb_ms"] <= meta["latency_ms"]
+
+def test_vision_sums_tokens_over_retries():
+    session = Session(Streamed("```python\nprint(1)```"), Streamed("no sections here"), Streamed(SECTIONS))
+    content, meta = InferenceClient("t", session=session).vision("prompt", "aGk=")
+    assert content == SECTIONS
+    assert meta["attempts"] == 3
+    assert (meta["prompt_tokens"], meta["completion_tokens"]) == (2400, 450)
+
+def test_failed_call_keeps_retried_tokens():
+    session = Session(Streamed("no sections here"), Failed())
+    with pytest.raises(InferenceError) as err:
+        InferenceClient("t", session=session).vision("prompt", "aGk=", max_retries=2)
+    assert err.value.meta["prompt_tokens"] == 800
+    assert err.value.meta["ttfb_ms"] is None
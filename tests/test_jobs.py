@@ -0,0 +1,93 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from autopsy.jobs import (AGING_S, BULK, DEFAULT_CLASS_CAPS, DONE, FAILED, FREE, MAX_ATTEMPTS, PAID, QUEUED, RUNNING,
+                          JobQueue, JobStore, parse_class_caps)
+from autopsy.storage import storage_target
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"))
+
+def test_storage_target():
+    assert storage_target({"STORAGE_BACKEND": "sqlite", "LOCAL_DB_PATH": "/srv/a.db"}) == "sqlite:/srv/a.db"
+    assert storage_target({"SUPABASE_URL": "https://x.supabase.co/", "SUPABASE_KEY": "k"}) == "supabase:https://x.supabase.co"
+    assert storage_target({}) is None
+
+def test_claims_only_own_backend(store):
+    theirs = store.create("u", "text", {}, backend="sqlite:/b.db")
+    ours = store.create("u", "text", {}, backend="sqlite:/a.db")
+    assert store.claim(backend="sqlite:/a.db")["id"] == ours
+    assert store.claim(backend="sqlite:/a.db") is None
+    assert not store.has_claimable(backend="sqlite:/a.db")
+    assert store.claim(backend="sqlite:/b.db")["id"] == theirs
+
+def test_untagged_jobs_go_to_any_worker(store):
+    legacy = store.create("u", "text", {})
+    assert store.claim(backend="sqlite:/a.db")["id"] == legacy
+
+def _age(store, job_id, seconds):
+    """Backdate a job's created_at"""
+    created = (datetime.now(timezone.utc) - timedelta(seconds=seconds)).isoformat()
+    with store._connect() as conn:
+        conn.execute("update jobs set created_at = ? where id = ?", [created, job_id])
+
+def test_claims_by_class_then_age(store):
+    bulk = store.create_many("u", "text", [{}], BULK)[0]
+    free_new = store.create("u", "text", {}, FREE)
+    free_old = store.create("u", "text", {}, FREE)
+    paid = store.create("u", "text", {}, PAID)
+    _age(store, free_old, 10)
+    claimed = [store.claim(caps={})["id"] for _ in range(4)]
+    assert claimed == [paid, free_old, free_new, bulk]
+    assert store.claim(caps={}) is None
+
+def test_waiting_jobs_move_up(store):
+    fresh = store.create("u", "text", {}, FREE)
+    starving = store.create_many("u", "text", [{}], BULK)[0]
+    _age(store, starving, 2.5 * AGING_S)          # bulk rank 2 - 2.5 < free rank 1
+    assert store.claim(caps={})["id"] == starving
+    assert store.claim(caps={})["id"] == fresh
+
+def test_class_caps(store):
+    first, second = store.create_many("u", "text", [{}, {}], BULK)
+    free = store.create("u", "text", {}, FREE)
+    caps = parse_class_caps("bulk:1")
+    assert store.claim(caps)["id"] == free
+    assert store.claim(caps)["id"] == first           # batch order kept within a submit
+    assert store.claim(caps) is None                  # bulk is at its cap
+    assert not store.has_claimable(caps)
+    store.finish(first, {"ok": True})
+    assert store.claim(caps)["id"] == second
+
+def test_parse_class_caps():
+    assert parse_class_caps("") == DEFAULT_CLASS_CAPS
+    assert parse_class_caps("free:6, bulk:2, nope:1") == {BULK: 2, FREE: 6}
+
+def test_stale_jobs_requeue_then_fail(store):
+    job_id = store.create("u", "text", {"img_b64": "abc"})
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        assert store.claim()["attempts"] == attempt
+        assert store.requeue_stale(lease_s=-1) == 1
+    job = store.get(job_id)
+    assert job["status"] == FAILED
+    assert "img_b64" not in job["params"]
+
+def test_queue_runs_and_fails_jobs(store):
+    def handler(job):
+        if job["params"].get("boom"):
+            raise ValueError("bad input")
+        return {"echo": job["params"]["n"]}
+
+    queue = JobQueue(store, handler, workers=2, poll_interval=0.01)
+    try:
+        ok, bad = queue.submit("u", "text", {"n": 1}), queue.submit("u", "text", {"boom": True})
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and {store.get(ok)["status"], store.get(bad)["status"]} & {QUEUED, RUNNING}:
+            time.sleep(0.01)
+    finally:
+        queue.stop(timeout=2)
+    assert store.get(ok)["status"] == DONE and store.get(ok)["result"] == {"echo": 1}
+    assert store.get(bad)["status"] == FAILED and store.get(bad)["error"] == "ValueError: bad input"
@@ -0,0 +1,59 @@
+from autopsy.parsing import enforce_catastrophe_rules, parse_report, validate_score
+from autopsy.tags import encode_tags
+
+REPORT = """[SCORE] 72
+[OVERALL_GRADE] B+
+[ENTRY_QUALITY] 70
+[EXIT_QUALITY] 65
+[RISK_SCORE] 60
+[TAGS] FOMO, Late_Entry, ok
+[TECH] Entry came after the breakout had already run two full candles.
+[PSYCH] Chased the move after watching it lift off without a position.
+[RISK] Stop was sized sensibly at roughly one ATR below the entry.
+[FIX] Wait for the first pullback to the breakout level before entering.
+[STRENGTH] Respected the stop and kept the loss small and controlled.
+[CRITICAL_ERROR] Entered late on fear of missing the move entirely.
+[END]"""
+
+def test_sections():
+    report = parse_report(REPORT)
+    assert (report["score"], report["overall_grade"]) == (72, "B+")
+    assert (report["entry_quality"], report["exit_quality"], report["risk_score"]) == (70, 65, 60)
+    assert report["tags"] == ["FOMO", "Late_Entry"]             # too-short tags dropped
+    assert report["tag_codes"] == encode_tags(["FOMO", "Late_Entry"])
+    assert report["tech"].startswith("Entry came after the breakout")
+    assert report["critical_error"] == "Entered late on fear of missing the move entirely."
+
+def test_missing_sections_fall_back():
+    report = parse_report("Overall score: 140\nNothing else useful here.")
+    assert report["score"] == 100
+    assert report["tags"] == []
+    assert report["strength"] == "N/A"
+    assert report["tech"].startswith("Technical analysis unavailable")
+
+def test_validate_score():
+    assert validate_score("abc") == 50
+    assert validate_score(-5) == 0
+    assert validate_score(90, context={"drawdown": 60, "metric_type": "overall"}) == 5
+    assert validate_score(90, context={"drawdown": 40, "metric_type": "overall"}) == 15
+    assert validate_score(0, context={"drawdown": 40, "metric_type": "overall"}) == 5
+    assert validate_score(80, context={"is_crisis": True, "metric_type": "risk"}) == 10
+
+def test_crisis_drawdown_caps_score_and_grade():
+    report = parse_report(REPORT.replace("[SCORE] 72", "Drawdown: $12,000 (-45%)\n[SCORE] 72"))
+    assert report["score"] == 15
+    assert report["overall_grade"] == "F"
+    assert report["risk_score"] == 10
+
+def test_no_stop_caps_exit_quality():
+    report = parse_report(REPORT.replace("[EXIT_QUALITY] 65", "[EXIT_QUALITY] 80 with no stop"))
+    assert report["exit_quality"] == 30
+
+def test_catastrophe_rules():
+    text = REPORT + "\nThis is a catastrophic position."
+    report = parse_report(REPORT)
+    assert enforce_catastrophe_rules(report, text)
+    assert (report["score"], report["overall_grade"], report["risk_score"]) == (14, "F", 20)
+    # Already low: left alone
+    assert not enforce_catastrophe_rules(report, text)
+    assert not enforce_catastrophe_rules(parse_report(REPORT), REPORT)
@@ -0,0 +1,48 @@
+import logging
+import time
+
+from autopsy.patterns import PatternCache, mine_sequences
+from autopsy.tags import TAXONOMY
+
+A, B, C = 1, 2, 3
+
+def _wait(cache, user_id, version, load, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        rules = cache.get(user_id, version, load)
+        if rules is not None:
+            return rules
+        time.sleep(0.01)
+    raise AssertionError("miner did not finish")
+
+def test_mines_gapped_sequence():
+    # A is followed by B within MAX_GAP audits every time, C is noise
+    history = [[A], [], [B], [C], [A], [B], [], [C], [A], [C], [B], [], [C]]
+    rules = mine_sequences(history)
+    top = {(r.antecedent, r.consequent): r for r in rules}
+    rule = top[((TAXONOMY[A],), TAXONOMY[B])]
+    assert rule.support == 3
+    assert rule.confidence == 1.0
+
+def test_gap_and_support_limits():
+    spread = [[A], [], [], [], [], [B]] * 3          # B arrives after MAX_GAP
+    assert mine_sequences(spread) == []
+    assert mine_sequences([[A], [B]] * 2) == []     # below MIN_SUPPORT
+    assert mine_sequences([]) == []
+
+def test_cache_is_bounded_lru():
+    cache = PatternCache(max_workers=1, max_users=2)
+    for user in ("u1", "u2"):
+        _wait(cache, user, 1, lambda: [])
+    cache.get("u1", 1, lambda: [])                   # u1 read last: u2 is evicted next
+    _wait(cache, "u3", 1, lambda: [])
+    assert list(cache._results) == ["u1", "u3"]
+
+def test_cache_logs_miner_errors(caplog):
+    def broken():
+        raise RuntimeError("history unavailable")
+
+    cache = PatternCache(max_workers=1)
+    with caplog.at_level(logging.ERROR, logger="autopsy.patterns"):
+        assert _wait(cache, "u", 1, broken) == []
+    assert "sequence mining failed for u" in caplog.text
@@ -0,0 +1,48 @@
+import re
+
+import pytest
+
+from autopsy.prompts import COMPACT, END_MARKER, FULL, PROMPTS, pick_variant, template
+from autopsy.tokens import budget_for, count_tokens
+
+@pytest.mark.parametrize("name", sorted(PROMPTS))
+def test_system_prefix_within_budget(name):
+    budget = budget_for(name)
+    if budget is None:
+        pytest.skip(f"{name} has no mode budget")
+    for image in (False, True):
+        assert count_tokens(PROMPTS[name].system_for(image=image)) <= budget
+
+@pytest.mark.parametrize("name", sorted(n for n in PROMPTS if n.endswith(f".{COMPACT}")))
+def test_compact_variant_is_smaller(name):
+    full = PROMPTS[name.partition(".")[0]]
+    compact = PROMPTS[name]
+    assert compact.version == full.version
+    assert count_tokens(compact.system) < count_tokens(full.system)
+    assert END_MARKER in compact.system
+
+def test_variant_lookup():
+    assert template("trade_audit", COMPACT).name == "trade_audit.compact"
+    assert template("portfolio_review", COMPACT) is PROMPTS["portfolio_review"]     # no compact text
+    assert template("trade_audit").name == "trade_audit"
+
+def test_pick_variant():
+    assert pick_variant(None, "u") == FULL
+    assert pick_variant("COMPACT", "u") == COMPACT
+    assert pick_variant("bogus", "u") == FULL
+    # A/B split is stable per user and uses both arms
+    arms = {pick_variant("ab", f"user{i}") for i in range(50)}
+    assert arms == {FULL, COMPACT}
+    assert pick_variant("ab", "alice") == pick_variant("ab", "alice")
+
+def test_budget_names_variants_by_mode():
+    assert budget_for("trade_audit.compact") == budget_for("trade_audit")
+
+def test_typed_chart_prompts_drop_the_other_type():
+    trade = PROMPTS["chart_trade"].system_for(image=True)
+    portfolio = PROMPTS["chart_portfolio"].system_for(image=True)
+    assert "portfolio" not in trade.lower()
+    assert not re.search(r"\b(single )?trades?\b", portfolio, re.IGNORECASE)
+    for system in (trade, portfolio):
+        assert "TYPE:" not in system
+        assert "[TECH] P/L:" in system
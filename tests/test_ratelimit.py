@@ -0,0 +1,52 @@
+import pytest
+
+from autopsy.jobs import PAID
+from autopsy.ratelimit import PLAN_TIERS, RateLimited, RateLimiter, parse_user_plans
+
+FREE_TIER = PLAN_TIERS["free"]
+
+@pytest.fixture
+def limiter(tmp_path):
+    return RateLimiter(str(tmp_path / "jobs.db"), user_plans={"pro_user": "pro"}, global_burst=2)
+
+def test_parse_user_plans():
+    assert parse_user_plans("a:pro, b:Desk,broken,") == {"a": "pro", "b": "desk"}
+    assert parse_user_plans({"a": "PRO"}) == {"a": "pro"}
+    assert parse_user_plans(None) == {}
+
+def test_tiers(limiter):
+    assert limiter.tier_for("pro_user").priority == PAID
+    assert limiter.tier_for("someone") is FREE_TIER
+
+def test_burst_then_throttled(limiter):
+    for _ in range(FREE_TIER.burst):
+        limiter.admit("u")
+    with pytest.raises(RateLimited) as exc:
+        limiter.admit("u")
+    # One token refills at per_minute / 60 per second
+    assert 0 < exc.value.retry_after <= 60 / FREE_TIER.per_minute
+    assert limiter.usage("u")["used_today"] == FREE_TIER.burst
+    assert limiter.stats()["user:u"] == {"allowed": FREE_TIER.burst, "throttled": 1}
+
+def test_users_have_separate_buckets(limiter):
+    for _ in range(FREE_TIER.burst):
+        limiter.admit("u")
+    limiter.admit("v")
+
+def test_daily_quota_counts_bulk_imports(limiter):
+    with pytest.raises(RateLimited, match="Daily limit reached"):
+        limiter.admit("u", count=FREE_TIER.daily_quota + 1)
+    limiter.admit("u", count=FREE_TIER.daily_quota)       # one submit, the whole quota
+    with pytest.raises(RateLimited, match="Daily limit reached") as exc:
+        limiter.admit("u")
+    assert exc.value.retry_after <= 86400
+    assert limiter.usage("u")["used_today"] == FREE_TIER.daily_quota
+
+def test_global_bucket_and_refund(limiter):
+    assert limiter.acquire_global()[0]
+    assert limiter.acquire_global()[0]
+    ok, wait = limiter.acquire_global()
+    assert not ok and wait > 0
+    limiter.refund_global()
+    assert limiter.acquire_global()[0]
+    assert limiter.stats()["global"] == {"allowed": 2, "deferred": 1}
@@ -0,0 +1,55 @@
+from autopsy.backfill import reparse_row, run_backfill
+from autopsy.engine import AuditEngine
+from autopsy.tags import codes_missing, encode_tags, row_tag_codes
+
+def test_codes_missing():
+    assert codes_missing(None, ["FOMO"])
+    assert codes_missing(None, [])
+    assert codes_missing([], ["FOMO"])          # the old empty-array default
+    assert not codes_missing([], [])
+    assert not codes_missing([1], ["FOMO"])
+
+def test_row_tag_codes_encodes_legacy_rows():
+    assert row_tag_codes([], ["FOMO", "No_Stops"]) == encode_tags(["FOMO", "No_Stops"])
+    assert row_tag_codes(None, None) == []
+    assert row_tag_codes([6], ["FOMO"]) == [6]
+
+def _legacy_rows(repo):
+    # One row from before the taxonomy (NULL codes), one carrying the old '[]' default
+    repo.insert_trade({"user_id": "u", "score": 30, "mistake_tags": ["FOMO"]})
+    repo.insert_trade({"user_id": "u", "score": 70, "mistake_tags": ["FOMO", "No_Stops"], "mistake_tag_codes": []})
+
+def test_rebuild_encodes_legacy_tags(repo):
+    _legacy_rows(repo)
+    agg = AuditEngine(client=None, repo=repo).load_aggregates("u")
+    assert agg.total_audits == 2
+    assert dict(agg.top_tags())["FOMO"] == 2
+
+def test_backfill_encodes_rows_without_raw_response(repo):
+    _legacy_rows(repo)
+    scanned, changed, fields = run_backfill(repo, workers=1, log=lambda *a: None)
+    assert (scanned, changed) == (2, 2)
+    assert fields == {"mistake_tag_codes": 2}
+    rows = repo.fetch_history("u", columns=("mistake_tag_codes", "parser_version"), newest_first=False)
+    assert [r["mistake_tag_codes"] for r in rows] == [encode_tags(["FOMO"]), encode_tags(["FOMO", "No_Stops"])]
+    assert all(r["parser_version"] is None for r in rows)     # nothing was re-parsed
+
+def test_reparse_row_leaves_encoded_rows_alone():
+    row = {"id": 1, "user_id": "u", "raw_response": None, "mistake_tags": ["FOMO"], "mistake_tag_codes": [1]}
+    assert reparse_row(row) == (1, "u", {})
+
+def test_backfill_invalidates_aggregates(repo):
+    _legacy_rows(repo)
+    repo.insert_trade({"user_id": "v", "score": 50, "mistake_tags": [], "mistake_tag_codes": []})
+    engine = AuditEngine(client=None, repo=repo)
+    engine.load_aggregates("v")
+    # A row cached before the backfill, built from the un-encoded history
+    stale = engine.load_aggregates("u")
+    stale.tag_counts.clear()
+    repo.delete_aggregates(["u"])
+    repo.insert_aggregates(stale.to_row())
+
+    run_backfill(repo, workers=1, log=lambda *a: None)
+    assert repo.fetch_aggregates("u") is None           # dropped, rebuilt on next load
+    assert repo.fetch_aggregates("v") is not None       # nothing of v's changed
+    assert dict(engine.load_aggregates("u").top_tags())["FOMO"] == 2
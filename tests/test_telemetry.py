@@ -0,0 +1,50 @@
+import math
+from datetime import datetime, timezone
+
+from autopsy.telemetry import (BUDGET_FLOOR, BUDGET_HEADROOM, BUDGET_MIN_SAMPLES, CompletionBudgets,
+                               completion_budgets, rollup)
+
+def _calls(mode, tokens, finish="stop", status="ok"):
+    return [{"mode": mode, "status": status, "completion_tokens": t, "finish_reason": finish} for t in tokens]
+
+def test_budget_from_p99_with_headroom():
+    budgets = completion_budgets(_calls("Text Parameters", range(1000, 1100)))
+    # p99 of 1000..1099 is 1098.01
+    assert budgets == {"Text Parameters": math.ceil(1098.01 * BUDGET_HEADROOM)}
+
+def test_budget_floor_and_sample_minimum():
+    assert completion_budgets(_calls("A", [100] * BUDGET_MIN_SAMPLES)) == {"A": BUDGET_FLOOR}
+    assert completion_budgets(_calls("A", [900] * (BUDGET_MIN_SAMPLES - 1))) == {}
+
+def test_truncating_modes_and_failures_are_left_out():
+    cut = _calls("A", [900] * 90) + _calls("A", [900] * 10, finish="length")
+    assert completion_budgets(cut) == {}
+    failed = _calls("A", [900] * BUDGET_MIN_SAMPLES, status="error")
+    assert completion_budgets(failed) == {}
+
+def test_budgets_are_capped_at_the_ceiling(repo):
+    for row in _calls("Text Parameters", [2000] * BUDGET_MIN_SAMPLES):
+        repo.insert_inference_log({**row, "created_at": datetime.now(timezone.utc).isoformat()})
+    budgets = CompletionBudgets()
+    assert budgets.max_tokens(repo, "Text Parameters", 1500) == 1500
+    assert budgets.max_tokens(repo, "Text Parameters", 4000) == 2400
+    assert budgets.max_tokens(repo, "Chart Vision", 2500) == 2500           # nothing learned yet
+    assert budgets.max_tokens(None, "Text Parameters", 4000) == 2400        # cached
+
+def test_rollup():
+    rows = [
+        {"created_at": "2026-10-01T10:00:00+00:00", "user_id": "u", "mode": "A", "status": "ok",
+         "prompt_tokens": 900, "completion_tokens": 200, "latency_ms": 1000, "attempts": 1, "finish_reason": "stop"},
+        {"created_at": "2026-10-02T10:00:00+00:00", "user_id": "u", "mode": "A", "status": "error",
+         "prompt_tokens": 900, "completion_tokens": None, "latency_ms": 3000, "attempts": 3, "finish_reason": None},
+        {"created_at": "2026-10-02T11:00:00+00:00", "user_id": "v", "mode": "B", "status": "ok",
+         "prompt_tokens": 500, "completion_tokens": 100, "latency_ms": 500, "attempts": 1, "finish_reason": "length"},
+    ]
+    by_mode = rollup(rows)
+    assert by_mode.index.tolist() == ["A", "B"]
+    assert by_mode.loc["A", "calls"] == 2
+    assert by_mode.loc["A", "error_rate_%"] == 50
+    assert by_mode.loc["A", "prompt_tokens"] == 1800
+    assert by_mode.loc["B", "truncated_%"] == 100
+    assert rollup(rows, by="day").loc["2026-10-02", "calls"] == 2
+    assert rollup([]).empty